@@ -0,0 +1,36 @@
+import os
+
+# ==========================================
+# 計算用プロセスのエントリポイント (モデルと履歴はプロセス内に保持したまま)
+# ==========================================
+# numpy / scikit-learn はワーカー側でだけ読み込むため、ここでは import しない
+# 履歴の列指向スナップショットの置き場所 (シャードごとに別ディレクトリ)
+HISTORY_SNAPSHOT_DIR = os.getenv('HISTORY_SNAPSHOT_DIR', 'history_snapshot')
+_model = None
+
+def worker_init():
+    global _model
+    from price_model import PriceModel
+    shard = os.getenv('SHARD_IDS', '').replace(',', '-').replace(' ', '') or 'main'
+    _model = PriceModel(os.path.join(HISTORY_SNAPSHOT_DIR, f"shard-{shard}"))
+
+def worker_sync(max_timestamp, changed_since=None):
+    # DB の最新時刻より後の行と changed_since 以降の行をスナップショットから落とし、(件数, 最終時刻) を返す
+    return _model.sync(max_timestamp, changed_since)
+
+def worker_append(rows):
+    # rows: timestamp 昇順の (timestamp, price, month, day, hour, deviation, momentum)
+    # 特徴量が未保存の行は計算し、DB に書き戻す分を返す
+    return _model.append(rows)
+
+def worker_push(timestamp, price, month, day, hour):
+    return _model.push(timestamp, price, month, day, hour)
+
+def worker_refit(force=False):
+    # 学習はワーカー内の別スレッドで進め、ここではすぐに返す (その間の予測は前のモデルで行う)
+    if _model.count >= 10 and (force or _model.needs_refit()):
+        _model.start_refit()
+    return _model.trained_rows
+
+def worker_analyze(month, day, hour):
+    return _model.analyze(month, day, hour)
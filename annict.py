@@ -0,0 +1,94 @@
+import os
+import asyncio
+import time
+from collections import OrderedDict
+import aiohttp
+import metrics
+
+# ==========================================
+# Annict API クライアント (非同期・接続再利用・キャッシュ付き)
+# ==========================================
+# 検証用のスタブサーバーに向けられるよう、接続先は環境変数で差し替えられる
+ANNICT_API_URL = os.getenv('ANNICT_API_URL', "https://api.annict.com/v1/works")
+ANNICT_TIMEOUT = float(os.getenv('ANNICT_TIMEOUT', '10'))
+# この秒数まではキャッシュをそのまま返す
+ANNICT_CACHE_TTL = float(os.getenv('ANNICT_CACHE_TTL', '3600'))
+# TTL 切れでもこの秒数までは古い結果を即返し、裏で取り直す (stale-while-revalidate)
+ANNICT_STALE_TTL = float(os.getenv('ANNICT_STALE_TTL', '86400'))
+ANNICT_CACHE_SIZE = int(os.getenv('ANNICT_CACHE_SIZE', '256'))
+
+class AnnictClient:
+    def __init__(self, token, *, base_url=ANNICT_API_URL, timeout=ANNICT_TIMEOUT,
+                 ttl=ANNICT_CACHE_TTL, stale_ttl=ANNICT_STALE_TTL, maxsize=ANNICT_CACHE_SIZE):
+        self.token = token
+        self.base_url = base_url
+        self.timeout = timeout
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.maxsize = maxsize
+        self._session = None
+        self._cache = OrderedDict()   # key -> (取得時刻, works)
+        self._inflight = {}
+
+    def _get_session(self):
+        # セッションはループ上で作る必要があるので初回利用時に作成し、以後は keep-alive で使い回す
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=10, keepalive_timeout=60),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @metrics.subsystem('annict.fetch')
+    async def _fetch(self, key, params):
+        # トークン未設定 (スタブサーバー相手など) のときはパラメータ自体を付けない (None は aiohttp が受け付けない)
+        if self.token is not None: params = {'access_token': self.token, **params}
+        async with self._get_session().get(self.base_url, params=params) as res:
+            res.raise_for_status()
+            works = (await res.json()).get('works', [])
+        self._cache[key] = (time.monotonic(), works)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return works
+
+    def _refresh(self, key, params):
+        # 同じキーの取得が走っていればそれを使う
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, params))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return task
+
+    def _done(self, key, task):
+        self._inflight.pop(key, None)
+        # 裏での再取得が失敗しても、古いキャッシュを返し続ける
+        if not task.cancelled() and task.exception() is not None:
+            print(f'Annict fetch error: {task.exception()}')
+
+    async def _get(self, key, params):
+        entry = self._cache.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.ttl:
+                self._cache.move_to_end(key)
+                return entry[1]
+            if age < self.stale_ttl:
+                self._refresh(key, params)
+                return entry[1]
+        return await asyncio.shield(self._refresh(key, params))
+
+    async def season_ranking(self, season, per_page=10):
+        # season: "2026-spring" など
+        return await self._get(('season', season, per_page),
+                               {'filter_season': season, 'sort_watchers_count': 'desc', 'per_page': per_page})
+
+    async def search(self, title, per_page=3):
+        return await self._get(('title', ' '.join(title.lower().split()), per_page),
+                               {'filter_title': title, 'per_page': per_page})
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+# ==========================================
+# 件数・最新 n 件・最新1件削除の所要時間 (件数を変えて比較)
+# ==========================================
+# python -m bench.counts --sizes 1000,100000,1000000
+# /status・/prediction の件数表示、/show_data の最新 10 件、/delete_latest の削除を、
+# history の件数を増やしながら測る (削除は毎回ロールバックする)。
+# old_count は以前の実装と同じく全件を読み込んで数える (--baseline-max 件まで)。
+# BENCH_DATABASE_URL の history テーブルを空にしてから使うので、本番の DB には向けないこと。
+BENCH_DATABASE_URL = os.getenv('BENCH_DATABASE_URL')
+if not BENCH_DATABASE_URL: sys.exit("❌ BENCH_DATABASE_URL を指定してください (history テーブルを空にします)")
+os.environ['DATABASE_URL'] = BENCH_DATABASE_URL
+
+# cogs/prediction.py の delete_latest と同じ文
+DELETE_LATEST_SQL = "DELETE FROM history WHERE timestamp = (SELECT timestamp FROM history ORDER BY timestamp DESC LIMIT 1) RETURNING timestamp"
+
+async def grow(conn, current, target):
+    # 10 分おきの行を target 件まで足す
+    await conn.execute('''
+        INSERT INTO history (timestamp, price, month, day, hour)
+        SELECT ts, 100 + random() * 20, EXTRACT(MONTH FROM ts), EXTRACT(DAY FROM ts), EXTRACT(HOUR FROM ts)
+        FROM (SELECT TIMESTAMPTZ '2000-01-01' + make_interval(mins => 10 * i) AS ts FROM generate_series($1::int, $2::int - 1) AS i) s
+    ''', current, target)
+    await conn.execute("ANALYZE history")
+
+async def median(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return samples[len(samples) // 2] * 1000
+
+async def main(args):
+    import db
+    await db.init_db_pool()
+    try:
+        await db.init_db()
+        async with db.get_db_connection() as conn:
+            await conn.execute("TRUNCATE history")
+
+        async def count_cached():
+            await db.get_history_count()
+
+        async def count_cold():
+            db.reset_history_count()
+            await db.get_history_count()
+
+        async def tail():
+            await db.load_history_tail(10)
+
+        async def delete_latest():
+            async with db.get_db_connection() as conn:
+                tr = conn.transaction()
+                await tr.start()
+                try: await conn.fetch(DELETE_LATEST_SQL)
+                finally: await tr.rollback()
+
+        async def old_count():
+            async with db.get_db_connection() as conn:
+                len(await conn.fetch("SELECT * FROM history ORDER BY timestamp ASC"))
+
+        print(f"{'rows':>9} {'count ms':>9} {'cold count ms':>14} {'tail ms':>8} {'delete ms':>10} {'old count ms':>13}")
+        current = 0
+        for n in sorted(int(s) for s in args.sizes.split(',')):
+            async with db.get_db_connection() as conn:
+                await grow(conn, current, n)
+            current = n
+            db.reset_history_count()
+            row = [await median(count_cached, args.repeat), await median(count_cold, 3),
+                   await median(tail, args.repeat), await median(delete_latest, args.repeat)]
+            old = f"{await median(old_count, 3):.1f}" if n <= args.baseline_max else '-'
+            print(f"{n:>9} {row[0]:>9.3f} {row[1]:>14.1f} {row[2]:>8.2f} {row[3]:>10.2f} {old:>13}")
+    finally:
+        await db.close_db_pool()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="history の件数を変えながら集計系のクエリを測ります")
+    parser.add_argument('--sizes', default='1000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--baseline-max', type=int, default=1000000)
+    asyncio.run(main(parser.parse_args()))
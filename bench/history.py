@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+# ==========================================
+# 一括取り込みとスナップショット読み込みのベンチマーク
+# ==========================================
+# python -m bench.history --rows 1000000
+# BENCH_DATABASE_URL の history テーブルを空にしてから使うので、本番の DB には向けないこと。
+BENCH_DATABASE_URL = os.getenv('BENCH_DATABASE_URL')
+if not BENCH_DATABASE_URL: sys.exit("❌ BENCH_DATABASE_URL を指定してください (history テーブルを空にします)")
+os.environ['DATABASE_URL'] = BENCH_DATABASE_URL
+# 100 万件での初回学習は既定のタイムアウトを超えうるので、計測中は延ばしておく
+os.environ.setdefault('COMPUTE_TIMEOUT', '1800')
+
+def synthetic_records(n, start, seed=1):
+    # 10 分おきのランダムウォーク (COPY_COLUMNS 順)
+    import random
+    from config import timezone_jp
+    rng = random.Random(seed)
+    price = 100.0
+    for i in range(n):
+        price = max(1.0, price + rng.uniform(-3, 3))
+        local = (start + timedelta(minutes=10 * i)).astimezone(timezone_jp)
+        yield (start + timedelta(minutes=10 * i), round(price, 1), local.month, local.day, local.hour, None)
+
+async def timed(label, coro):
+    started = time.perf_counter()
+    result = await coro
+    elapsed = time.perf_counter() - started
+    print(f"{label:<32} {elapsed * 1000:10.1f} ms")
+    return result, elapsed
+
+async def main(rows, extra):
+    import db
+    from ingest import ingest_records
+    from cogs.prediction import ComputeExecutor, PriceAnalytics
+
+    await db.init_db_pool()
+    try:
+        await db.init_db()
+        async with db.get_db_connection() as conn:
+            await conn.execute("TRUNCATE history")
+        start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        async with db.get_db_connection() as conn:
+            (total, _), elapsed = await timed(f"ingest {rows} rows", ingest_records(conn, synthetic_records(rows, start)))
+        print(f"{'ingest throughput':<32} {total / elapsed:10.0f} rows/s")
+
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            os.environ['HISTORY_SNAPSHOT_DIR'] = snapshot_dir
+            for label in ("load (cold snapshot)", "load (warm snapshot)"):
+                executor = ComputeExecutor()
+                executor.start()
+                analytics = PriceAnalytics(executor)
+                # ワーカーの起動 (numpy / scikit-learn の import) は読み込み時間に含めない
+                await timed("worker start", executor.run(None, os.getpid))
+                await timed(label, analytics.ensure_loaded())
+                if label.endswith("(warm snapshot)"): break
+                executor.shutdown()
+
+            # 末尾への追加分だけを差分で読み込む
+            async with db.get_db_connection() as conn:
+                await ingest_records(conn, synthetic_records(extra, start + timedelta(minutes=10 * rows), seed=2))
+            analytics.invalidate(start + timedelta(minutes=10 * rows))
+            await timed(f"load (+{extra} rows incremental)", analytics.ensure_loaded())
+            await timed("analyze (first, includes fit)", analytics.analyze())
+            await timed("analyze (cached model)", analytics.analyze())
+            executor.shutdown()
+    finally:
+        await db.close_db_pool()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="history の一括取り込みとスナップショット読み込みを計測します")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--extra', type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.extra))
@@ -0,0 +1,139 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+
+# ==========================================
+# DB アクセスの毎秒コマンド数 (呼び出しごとの接続 vs 接続プール)
+# ==========================================
+# python -m bench.pool --concurrency 8 --ops 2000
+# remind / remindlist / prediction が DB に対して行う処理を、次の2通りで流して比べる。
+#   connect: 以前の実装と同じく、呼び出しのたびに psycopg2.connect() する (イベントループ上で同期的に)
+#   pool:    db.py の asyncpg プールを使う
+# BENCH_DATABASE_URL の reminders / history に書き込み、終了時に書き込んだ行を消す。本番の DB には向けないこと。
+BENCH_DATABASE_URL = os.getenv('BENCH_DATABASE_URL')
+if not BENCH_DATABASE_URL: sys.exit("❌ BENCH_DATABASE_URL を指定してください")
+os.environ['DATABASE_URL'] = BENCH_DATABASE_URL
+
+# 実際の Discord の ID (snowflake) は 10^15 を下回らないので、USER_BASE から --users 件の小さい ID を使う
+USER_BASE = 1
+
+# --- 以前の実装 (psycopg2 で毎回接続) ---
+def connect_remindlist(psycopg2, user_id):
+    conn = psycopg2.connect(BENCH_DATABASE_URL)
+    with conn.cursor() as cur:
+        cur.execute("SELECT id, time, interval_weeks FROM reminders WHERE user_id = %s ORDER BY time ASC", (user_id,))
+        rows = cur.fetchall()
+    conn.close()
+    return rows
+
+def connect_remind(psycopg2, user_id, when):
+    if len(connect_remindlist(psycopg2, user_id)) >= 3: return
+    conn = psycopg2.connect(BENCH_DATABASE_URL); cur = conn.cursor()
+    cur.execute("INSERT INTO reminders (user_id, time, interval_weeks) VALUES (%s, %s, %s)", (user_id, when, 0))
+    conn.commit(); conn.close()
+
+def connect_save_price(psycopg2, now, price):
+    # 後で消せるように、追加した行の ctid を返す (計測用に足した RETURNING 以外は以前の実装と同じ)
+    conn = psycopg2.connect(BENCH_DATABASE_URL)
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO history (timestamp, price, month, day, hour) VALUES (%s, %s, %s, %s, %s) RETURNING ctid",
+                    (now, price, now.month, now.day, now.hour))
+        block, offset = cur.fetchone()[0].strip('()').split(',')
+    conn.commit()
+    conn.close()
+    return int(block), int(offset)
+
+# --- 接続プール ---
+async def pool_remindlist(db, user_id):
+    async with db.get_db_connection() as conn:
+        return await conn.fetch("SELECT id, time, interval_weeks FROM reminders WHERE user_id = $1 ORDER BY time ASC", user_id)
+
+async def pool_remind(db, user_id, when):
+    async with db.get_db_connection() as conn:
+        await conn.fetchval("INSERT INTO reminders (user_id, time, interval_weeks) SELECT $1, $2, 0 "
+                            "WHERE (SELECT COUNT(*) FROM reminders WHERE user_id = $1) < 3 RETURNING id", user_id, when)
+
+async def pool_save_price(db, now, price):
+    async with db.get_db_connection() as conn:
+        return await conn.fetchval("INSERT INTO history (timestamp, price, month, day, hour) VALUES ($1, $2, $3, $4, $5) RETURNING ctid",
+                                   now, price, now.month, now.day, now.hour)
+
+def make_ops(n, users, seed):
+    rng = random.Random(seed)
+    ops = []
+    for _ in range(n):
+        op = rng.choices(['remindlist', 'remind', 'save_price'], weights=[5, 3, 2])[0]
+        ops.append((op, USER_BASE + rng.randrange(users), rng.uniform(80, 120)))
+    return ops
+
+async def run(mode, ops, concurrency, db, psycopg2, inserted):
+    from config import timezone_jp
+    queue = asyncio.Queue()
+    for op in ops: queue.put_nowait(op)
+    latencies = []
+
+    async def worker():
+        while not queue.empty():
+            op, user_id, price = queue.get_nowait()
+            now = datetime.now(timezone_jp)
+            started = time.perf_counter()
+            if mode == 'connect':
+                # 以前の実装はコマンドハンドラーから直接呼んでいた (ループを止める)
+                if op == 'remindlist': connect_remindlist(psycopg2, user_id)
+                elif op == 'remind': connect_remind(psycopg2, user_id, now + timedelta(days=1))
+                else: inserted.append(connect_save_price(psycopg2, now, price))
+            else:
+                if op == 'remindlist': await pool_remindlist(db, user_id)
+                elif op == 'remind': await pool_remind(db, user_id, now + timedelta(days=1))
+                else: inserted.append(await pool_save_price(db, now, price))
+            latencies.append(time.perf_counter() - started)
+            # 応答の送信などで他のコマンドに順番を譲る
+            await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started, sorted(latencies)
+
+async def cleanup(db, users, inserted):
+    # 合成した利用者のリマインダーと、計測中に追加した history の行だけを消す
+    async with db.get_db_connection() as conn:
+        await conn.execute("DELETE FROM reminders WHERE user_id BETWEEN $1 AND $2", USER_BASE, USER_BASE + users)
+        await conn.execute("DELETE FROM history WHERE ctid = ANY($1::tid[])", inserted)
+    inserted.clear()
+
+async def main(args):
+    import db
+    try: import psycopg2
+    except ImportError: psycopg2 = None
+    modes = [m for m in args.modes.split(',') if m]
+    if 'connect' in modes and psycopg2 is None:
+        print("ℹ️ psycopg2 が無いため connect は省略します (pip install psycopg2-binary)")
+        modes.remove('connect')
+
+    await db.init_db_pool()
+    inserted = []   # 追加した history の行の ctid
+    try:
+        await db.init_db()
+        print(f"{'mode':<8} {'ops':>6} {'cmds/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+        for mode in modes:
+            await cleanup(db, args.users, inserted)
+            elapsed, latencies = await run(mode, make_ops(args.ops, args.users, args.seed), args.concurrency, db, psycopg2, inserted)
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+            print(f"{mode:<8} {len(latencies):>6} {len(latencies) / elapsed:>9.1f} {p50:>8.2f} {p99:>8.2f}")
+    finally:
+        await cleanup(db, args.users, inserted)
+        await db.close_db_pool()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="呼び出しごとの接続と接続プールで DB アクセスの処理量を比べます")
+    parser.add_argument('--ops', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--modes', default='connect,pool')
+    parser.add_argument('--seed', type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
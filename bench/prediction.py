@@ -0,0 +1,81 @@
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+# ==========================================
+# /prediction の計算部分の所要時間 (件数を変えて比較)
+# ==========================================
+# python -m bench.prediction --sizes 1000,100000,1000000
+# 計算用プロセスの中で行う処理 (PriceModel) だけを測る。DB は使わない。
+#   push:    1件追加して特徴量を更新する
+#   analyze: キャッシュ済みのモデルで予測と RSI を出す
+#   refit:   再学習 (MODEL_REFIT_ROWS 件ごと、または定期タスクでだけ、別スレッドで走る)
+#   restart: 再起動後に保存済みのモデルを読み込んで最初の予測を返すまで
+#   baseline: 以前の実装 (毎回 pandas で全件の特徴量を作り直して学習する)。--baseline-max 件まで測る
+
+def synthetic_rows(n, seed=1):
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    price = 100.0
+    for i in range(n):
+        ts = start + timedelta(minutes=10 * i)
+        price = max(1.0, price + rng.uniform(-3, 3))
+        yield (ts, round(price, 1), ts.month, ts.day, ts.hour, None, None)
+
+def baseline(rows):
+    import numpy as np
+    import pandas as pd
+    from sklearn.ensemble import RandomForestRegressor
+    df = pd.DataFrame([r[:5] for r in rows], columns=['timestamp', 'price', 'month', 'day', 'hour'])
+    df['ma5'] = df['price'].rolling(window=5, min_periods=1).mean()
+    df['deviation'] = (df['price'] - df['ma5']) / df['ma5'] * 100
+    df['momentum'] = df['price'].diff(3).fillna(0)
+    model = RandomForestRegressor(n_estimators=50, max_depth=7, random_state=42)
+    model.fit(df[['month', 'day', 'hour', 'deviation', 'momentum']].values, df['price'].values)
+    last = df.iloc[-1]
+    model.predict(np.array([[1, 1, 0, last['deviation'], last['momentum']]]))
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+def measure(n, repeat, baseline_max):
+    from price_model import PriceModel
+    rows = list(synthetic_rows(n + repeat))
+    with tempfile.TemporaryDirectory() as path:
+        model = PriceModel(path)
+        model.append(rows[:n])
+        started = time.perf_counter()
+        model.refit()
+        refit = time.perf_counter() - started
+        analyze = timed(lambda: model.analyze(1, 1, 0), repeat)
+        restart = timed(lambda: PriceModel(path).analyze(1, 1, 0), 1)
+        # push は最後に測る (MODEL_REFIT_ROWS 件を超えると裏で再学習が始まるため)
+        extra = iter(rows[n:])
+        push = timed(lambda: model.push(*next(extra)[:5]), repeat)
+        if model.refitting: model._refit_thread.join()
+        result = {'rows': n, 'push_ms': push * 1000, 'analyze_ms': analyze * 1000, 'refit_s': refit, 'restart_s': restart, 'baseline_s': None}
+    if n <= baseline_max:
+        result['baseline_s'] = timed(lambda: baseline(rows[:n]), 1)
+    return result
+
+def main(args):
+    print(f"{'rows':>9} {'push ms':>9} {'analyze ms':>11} {'refit s':>9} {'restart s':>10} {'baseline s':>11}")
+    for n in (int(s) for s in args.sizes.split(',')):
+        r = measure(n, args.repeat, args.baseline_max)
+        baseline_s = f"{r['baseline_s']:.2f}" if r['baseline_s'] is not None else '-'
+        print(f"{r['rows']:>9} {r['push_ms']:>9.3f} {r['analyze_ms']:>11.2f} {r['refit_s']:>9.2f} {r['restart_s']:>10.3f} {baseline_s:>11}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="件数ごとに予測の計算時間を測ります")
+    parser.add_argument('--sizes', default='1000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=20, help="push / analyze を測る回数 (中央値を表示)")
+    parser.add_argument('--baseline-max', type=int, default=100000, help="以前の実装を測る最大件数")
+    main(parser.parse_args())
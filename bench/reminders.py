@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+
+# ==========================================
+# リマインダー配信のストレステスト
+# ==========================================
+# python -m bench.reminders --count 10000 --spread 0
+# 期限の来た大量のリマインダーを、本物のスケジューラ・確保クエリ・送信処理で配信し、
+# Discord 側だけを偽のクライアントに差し替えて処理量と遅れ (期限から送信完了まで) を測る。
+# BENCH_DATABASE_URL の reminders に書き込み、終了時に消す。本番の DB には向けないこと。
+
+# 1件ごとに別の利用者にする。実際の Discord の ID (snowflake) は 10^15 を下回らないので、
+# USER_BASE から count 件の小さい ID なら既存の利用者と重ならない
+USER_BASE = 1
+
+class StubDiscord:
+    """get_user / fetch_user / user.send だけを持つ偽のクライアント。
+
+    cached の割合の利用者だけがキャッシュにいる (残りは fetch_user で取得される)。
+    rate を指定すると、送信全体を毎秒 rate 件に制限する (Discord のグローバル制限の代わり)。
+    """
+    def __init__(self, latency, cached, rate):
+        self.latency = latency
+        self.cached = cached
+        self.rate = rate
+        self.sent = {}        # user_id -> 送信完了時刻
+        self.duplicates = 0
+        self.fetched = 0
+        self._next_slot = 0.0
+
+    def _user(self, user_id):
+        client = self
+
+        class User:
+            id = user_id
+            mention = f"<@{user_id}>"
+
+            async def send(self, content=None, embed=None):
+                await client._throttle()
+                await asyncio.sleep(client.latency)
+                if user_id in client.sent: client.duplicates += 1
+                client.sent[user_id] = time.time()
+        return User()
+
+    async def _throttle(self):
+        if not self.rate: return
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + 1 / self.rate
+        if slot > now: await asyncio.sleep(slot - now)
+
+    def get_user(self, user_id):
+        return self._user(user_id) if (user_id - USER_BASE) % 100 < self.cached * 100 else None
+
+    async def fetch_user(self, user_id):
+        self.fetched += 1
+        await asyncio.sleep(self.latency)
+        return self._user(user_id)
+
+class StubLeader:
+    # 単一インスタンスなので、常にリーダーとして扱う
+    def add_listener(self, callback): pass
+    def remove_listener(self, callback): pass
+
+async def delete_synthetic(conn, count):
+    await conn.execute("DELETE FROM reminders WHERE user_id BETWEEN $1 AND $2", USER_BASE, USER_BASE + count)
+
+async def seed(conn, count, start, spread, timeout):
+    from config import timezone_jp
+    first_due = datetime.now(timezone_jp) + timedelta(seconds=start)
+    # 確保クエリは期限の来た行をすべて取るので、計測中に期限を迎える本物のリマインダーがあれば始めない
+    others = await conn.fetchval("SELECT COUNT(*) FROM reminders WHERE time <= $1 AND user_id NOT BETWEEN $2 AND $3",
+                                 first_due + timedelta(seconds=spread + timeout), USER_BASE, USER_BASE + count)
+    if others: raise RuntimeError(f"計測中に期限を迎える既存のリマインダーが {others} 件あります (空の DB で実行してください)")
+    times = [first_due + timedelta(seconds=spread * i / count) for i in range(count)]
+    await delete_synthetic(conn, count)
+    await conn.execute("INSERT INTO reminders (user_id, time, interval_weeks) SELECT u, t, 0 FROM unnest($1::bigint[], $2::timestamptz[]) AS x(u, t)",
+                       [USER_BASE + i for i in range(count)], times)
+    return {USER_BASE + i: t.timestamp() for i, t in enumerate(times)}
+
+async def run_stress(count, *, start=2.0, spread=0.0, latency=0.02, cached=0.8, rate=0.0, timeout=600):
+    """count 件を配信し、(送信済み件数, 重複件数, fetch_user 回数, 経過秒, 遅れの一覧) を返す。"""
+    import db
+    from listener import NotifyListener
+    from cogs.reminders import Reminders
+
+    stub = StubDiscord(latency, cached, rate)
+    bot = stub
+    bot.leader, bot.listener = StubLeader(), NotifyListener()
+    await db.init_db_pool()
+    try:
+        await db.init_db()
+        async with db.get_db_connection() as conn:
+            due = await seed(conn, count, start, spread, timeout)
+        await bot.listener.start()
+        cog = Reminders(bot)
+        await cog.cog_load()
+        await cog.on_leader_change(True)
+        first_due = min(due.values())
+        deadline = time.monotonic() + start + spread + timeout
+        while len(stub.sent) < count and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await cog.cog_unload()
+        await bot.listener.stop()
+        elapsed = max(stub.sent.values(), default=first_due) - first_due
+        lateness = sorted(stub.sent[u] - due[u] for u in stub.sent)
+        return len(stub.sent), stub.duplicates, stub.fetched, elapsed, lateness
+    finally:
+        async with db.get_db_connection() as conn:
+            await delete_synthetic(conn, count)
+        await db.close_db_pool()
+
+def percentile(values, q):
+    if not values: return 0.0
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+async def main(args):
+    sent, duplicates, fetched, elapsed, lateness = await run_stress(
+        args.count, start=args.start, spread=args.spread, latency=args.latency, cached=args.cached, rate=args.rate)
+    print(f"sent {sent}/{args.count} (duplicates {duplicates}, fetch_user {fetched}) in {elapsed:.2f}s = {sent / elapsed if elapsed > 0 else 0:.1f} DMs/s")
+    print(f"lateness p50 {percentile(lateness, 50) * 1000:.0f}ms / p99 {percentile(lateness, 99) * 1000:.0f}ms / max {percentile(lateness, 100) * 1000:.0f}ms")
+    if sent < args.count or duplicates: sys.exit(1)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="大量のリマインダーを偽の Discord クライアントへ配信して計測します")
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--start', type=float, default=2.0, help="最初の期限までの秒数")
+    parser.add_argument('--spread', type=float, default=0.0, help="期限を散らす幅 (秒)。0 なら全件が同時に期限を迎える")
+    parser.add_argument('--latency', type=float, default=0.02, help="DM 送信・fetch_user にかかる時間 (秒)")
+    parser.add_argument('--cached', type=float, default=0.8, help="get_user で見つかる利用者の割合")
+    parser.add_argument('--rate', type=float, default=0.0, help="送信全体の上限 (件/秒)。0 なら制限なし")
+    args = parser.parse_args()
+    # 設定は import 時に読まれるので、ここで差し替えてから読み込む
+    BENCH_DATABASE_URL = os.getenv('BENCH_DATABASE_URL')
+    if not BENCH_DATABASE_URL: sys.exit("❌ BENCH_DATABASE_URL を指定してください")
+    os.environ['DATABASE_URL'] = BENCH_DATABASE_URL
+    asyncio.run(main(args))
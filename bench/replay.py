@@ -0,0 +1,337 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+# ==========================================
+# コマンドハンドラーのリプレイ / ベンチマーク
+# ==========================================
+# 本物のハンドラー (cogs/ と bot.py のコマンド) を偽の Interaction で呼び出し、
+# 外部サービスはローカルのスタブに差し替えて計測する。
+#   python -m bench.replay --mix bench/mixes/default.json --concurrency 8 --ops 2000
+# Annict はローカルの HTTP スタブ、yt-dlp は抽出を模したスタブと事前投入したキャッシュ、
+# FFmpeg は何もしない音声ソースに置き換える。
+# BENCH_DATABASE_URL を指定すると、その Postgres を使って DB を使うコマンド (remind / remindlist /
+# prediction / show_data) も実行する (history / reminders に書き込むので本番には向けないこと)。
+# 指定しなければ DB を使わないコマンドだけを実行する。
+DB_OPS = {'remind', 'remindlist', 'prediction', 'show_data'}
+OPS = DB_OPS | {'status', 'anime', 'music'}
+
+BENCH_DATABASE_URL = os.getenv('BENCH_DATABASE_URL')
+if BENCH_DATABASE_URL:
+    os.environ['DATABASE_URL'] = BENCH_DATABASE_URL
+# 計算用プロセスのスナップショットは一時ディレクトリに置く
+os.environ.setdefault('HISTORY_SNAPSHOT_DIR', tempfile.mkdtemp(prefix='bench-history-'))
+os.environ.setdefault('METRICS_PORT', '')
+
+# --- 偽の Discord オブジェクト ---
+class FakeResponse:
+    def __init__(self, latency):
+        self._latency = latency
+        self._done = False
+        self.messages = []
+
+    def is_done(self):
+        return self._done
+
+    async def defer(self, **kwargs):
+        await asyncio.sleep(self._latency)
+        self._done = True
+
+    async def send_message(self, content=None, **kwargs):
+        await asyncio.sleep(self._latency)
+        self._done = True
+        self.messages.append((content, kwargs))
+
+class FakeFollowup:
+    def __init__(self, latency):
+        self._latency = latency
+        self.messages = []
+
+    async def send(self, content=None, **kwargs):
+        await asyncio.sleep(self._latency)
+        self.messages.append((content, kwargs))
+
+class FakeVoiceClient:
+    def __init__(self, guild, channel):
+        self.guild = guild
+        self.channel = channel
+        self.playing = None
+
+    def is_playing(self):
+        return self.playing is not None
+
+    def is_paused(self):
+        return False
+
+    def play(self, source, after=None):
+        # 実際には再生しない (音源の生成までを計測する)
+        self.playing = source
+        source.cleanup()
+
+    def stop(self):
+        self.playing = None
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self):
+        self.guild.voice_client = None
+
+class FakeVoiceChannel:
+    def __init__(self, guild):
+        self.id = guild.id
+        self.guild = guild
+
+    async def connect(self):
+        self.guild.voice_client = FakeVoiceClient(self.guild, self)
+        return self.guild.voice_client
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.voice_client = None
+
+def fake_interaction(user_id, guild, latency):
+    user = SimpleNamespace(id=user_id, mention=f"<@{user_id}>", voice=SimpleNamespace(channel=FakeVoiceChannel(guild)))
+    return SimpleNamespace(user=user, guild=guild, response=FakeResponse(latency), followup=FakeFollowup(latency))
+
+# --- 外部サービスのスタブ ---
+async def start_annict_stub(latency):
+    from aiohttp import web
+
+    async def works(request):
+        await asyncio.sleep(latency)
+        key = request.query.get('filter_season') or request.query.get('filter_title', '')
+        per_page = int(request.query.get('per_page', '10'))
+        return web.json_response({'works': [{'title': f"{key} #{i + 1}", 'official_site_url': f"https://example.com/{i}"} for i in range(per_page)]})
+
+    app = web.Application()
+    app.router.add_get('/v1/works', works)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1/works"
+
+def stub_info(query):
+    video_id = f"{abs(hash(query)) % 10 ** 11:011d}"
+    return {'id': video_id, 'title': f"track {query}", 'ext': 'm4a', 'duration': 180,
+            'webpage_url': f"https://www.youtube.com/watch?v={video_id}",
+            'url': f"https://media.example.com/{video_id}?expire={int(time.time()) + 6 * 3600}"}
+
+class StubYTDL:
+    """extract_info の代わり。抽出スレッド上で latency 秒かかったことにして結果を返す。"""
+    def __init__(self, latency):
+        self.latency = latency
+
+    def extract_info(self, query, download=False):
+        time.sleep(self.latency)
+        return stub_info(query)
+
+def install_media_stubs(music, latency, warm_queries):
+    import discord
+
+    class StubAudio(discord.AudioSource):
+        def __init__(self, source, **kwargs):
+            self.source = source
+
+        def read(self):
+            return b''
+
+    # FFmpegPCMAudio は生成時にプロセスを起動するので、何もしない音源に置き換える
+    discord.FFmpegPCMAudio = StubAudio
+    stub = StubYTDL(latency)
+    music.get_ytdl = lambda: stub
+    # 事前にキャッシュへ入れておく分 (ウォームキャッシュのヒットを再現する)
+    for query in warm_queries:
+        data = stub_info(query)
+        music.ytdl_cache._put([music.ytdl_cache_key(query)], music.ytdl_expires_at(data), data)
+
+# --- トラフィック ---
+def load_mix(path):
+    # .json: {"ops": {"anime": 20, ...}} の重み付き混合 / .jsonl: 記録した操作を1行1件で順に再生する
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            return 'sequence', [json.loads(line) for line in f if line.strip()]
+        return 'weights', json.load(f)['ops']
+
+def build_ops(kind, mix, count, with_db, seed):
+    rng = random.Random(seed)
+    if kind == 'sequence':
+        ops = [entry for entry in mix if with_db or entry['op'] not in DB_OPS]
+        return [ops[i % len(ops)] for i in range(count)] if ops else []
+    weights = {op: w for op, w in mix.items() if op in OPS and (with_db or op not in DB_OPS)}
+    names = list(weights)
+    return [{'op': op} for op in rng.choices(names, weights=[weights[n] for n in names], k=count)] if names else []
+
+class LoopBlockMonitor:
+    """短い間隔で眠り、予定より遅れて起きた分をイベントループが塞がれていた時間として数える。
+
+    タイマーの誤差で毎回わずかに遅れるので、threshold 秒を超えた遅れだけを塞がれていた時間に足す。
+    """
+    def __init__(self, interval=0.005, threshold=0.002):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - expected))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        self._task.cancel()
+
+def percentile(values, q):
+    if not values: return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+# --- 実行 ---
+class Replay:
+    def __init__(self, bot, args):
+        self.bot = bot
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.guild_seq = 0
+        from config import YOUR_USER_ID
+        self.owner_id = YOUR_USER_ID
+
+    def interaction(self, user_id=None):
+        self.guild_seq += 1
+        guild = FakeGuild(10_000 + self.guild_seq)
+        return fake_interaction(user_id or self.rng.randrange(1, self.args.users + 1) + 8_000_000_000, guild, self.args.discord_latency)
+
+    async def run_op(self, entry):
+        from discord import app_commands
+        op, args = entry['op'], entry.get('args', {})
+        bot = self.bot
+        if op == 'status':
+            await bot.tree.get_command('status').callback(self.interaction())
+        elif op == 'anime':
+            season = args.get('season') or self.rng.choice(['spring', 'summer', 'fall', 'winter'])
+            cog = bot.get_cog('Anime')
+            await cog.anime.callback(cog, self.interaction(), app_commands.Choice(name=season, value=season))
+        elif op == 'music':
+            query = args.get('query') or f"song {self.rng.randrange(self.args.tracks)}"
+            cog = bot.get_cog('Music')
+            await cog.music.callback(cog, self.interaction(), query)
+        elif op == 'remind':
+            when = datetime.now() + timedelta(days=1, seconds=self.rng.randrange(86400))
+            cog = bot.get_cog('Reminders')
+            await cog.remind.callback(cog, self.interaction(), when.strftime('%Y/%m/%d'), when.strftime('%H:%M:%S'))
+        elif op == 'remindlist':
+            cog = bot.get_cog('Reminders')
+            await cog.remindlist.callback(cog, self.interaction())
+        elif op == 'prediction':
+            cog = bot.get_cog('Prediction')
+            await cog.prediction.callback(cog, self.interaction(self.owner_id), args.get('price') or self.rng.randrange(80, 120))
+        elif op == 'show_data':
+            cog = bot.get_cog('Prediction')
+            await cog.show_data.callback(cog, self.interaction())
+
+    async def run(self, ops):
+        queue = asyncio.Queue()
+        for entry in ops: queue.put_nowait(entry)
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+
+        async def worker():
+            while not queue.empty():
+                entry = queue.get_nowait()
+                started = time.perf_counter()
+                try: await self.run_op(entry)
+                except Exception as e:
+                    errors[entry['op']] += 1
+                    if errors[entry['op']] == 1: print(f"⚠️ {entry['op']}: {e!r}")
+                latencies[entry['op']].append(time.perf_counter() - started)
+
+        monitor = LoopBlockMonitor()
+        monitor.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+        elapsed = time.perf_counter() - started
+        monitor.stop()
+        return elapsed, latencies, errors, monitor.lags, sum(l for l in monitor.lags if l > monitor.threshold)
+
+def report(elapsed, latencies, errors, lags, blocked, concurrency):
+    total = sum(len(v) for v in latencies.values())
+    result = {
+        'ops': total, 'seconds': elapsed, 'ops_per_sec': total / elapsed if elapsed else 0.0, 'concurrency': concurrency,
+        'commands': {op: {'count': len(v), 'errors': errors.get(op, 0),
+                          'p50_ms': percentile(v, 50) * 1000, 'p95_ms': percentile(v, 95) * 1000, 'p99_ms': percentile(v, 99) * 1000}
+                     for op, v in sorted(latencies.items())},
+        'loop_blocked_ms': blocked * 1000, 'loop_lag_max_ms': max(lags, default=0.0) * 1000, 'loop_lag_p99_ms': percentile(lags, 99) * 1000,
+    }
+    print(f"{total} ops in {elapsed:.2f}s = {result['ops_per_sec']:.1f} ops/s (concurrency {concurrency})")
+    print(f"{'command':<12} {'count':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for op, stats in result['commands'].items():
+        print(f"{op:<12} {stats['count']:>6} {stats['errors']:>4} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+    print(f"event loop: blocked {result['loop_blocked_ms']:.1f}ms total, max lag {result['loop_lag_max_ms']:.1f}ms, p99 lag {result['loop_lag_p99_ms']:.1f}ms")
+    return result
+
+async def main(args):
+    runner, annict_url = await start_annict_stub(args.annict_latency)
+    os.environ['ANNICT_API_URL'] = annict_url
+    # ANNICT_API_URL を反映させるため、ここから先で import する
+    import bot as bot_module
+    # 未接続のクライアントの latency は NaN になるので固定値にする
+    bot_module.ChulyBot.latency = property(lambda self: args.discord_latency)
+    bot = bot_module.bot
+
+    with_db = bool(BENCH_DATABASE_URL)
+    kind, mix = load_mix(args.mix)
+    ops = build_ops(kind, mix, args.ops, with_db, args.seed)
+    if not with_db: print("ℹ️ BENCH_DATABASE_URL が未設定のため、DB を使うコマンドは除外します")
+    if not ops: sys.exit("❌ 実行できる操作がありません")
+
+    await bot._async_setup_hook()
+    if with_db:
+        await bot.setup_hook()
+    else:
+        await bot.load_extension('cogs.anime')
+        await bot.load_extension('cogs.music')
+    # load_extension はモジュールを読み込み直すので、差し替えは読み込んだ後のモジュールに対して行う
+    install_media_stubs(sys.modules['cogs.music'], args.ytdl_latency, [f"song {i}" for i in range(int(args.tracks * args.warm))])
+    try:
+        replay = Replay(bot, args)
+        if args.warmup:
+            await replay.run(build_ops(kind, mix, args.warmup, with_db, args.seed + 1))
+        result = report(*await replay.run(ops), args.concurrency)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2)
+    finally:
+        await bot.close()
+        await runner.cleanup()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="コマンドハンドラーを偽の Interaction で再生して計測します")
+    parser.add_argument('--mix', default=os.path.join(os.path.dirname(__file__), 'mixes', 'default.json'))
+    parser.add_argument('--ops', type=int, default=1000, help="計測する操作の数")
+    parser.add_argument('--warmup', type=int, default=50, help="計測前に流す操作の数")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--users', type=int, default=200, help="remind / remindlist に使う利用者数")
+    parser.add_argument('--tracks', type=int, default=50, help="/music で使う曲数")
+    parser.add_argument('--warm', type=float, default=0.5, help="事前にキャッシュへ入れておく曲の割合")
+    parser.add_argument('--annict-latency', type=float, default=0.05, help="Annict スタブの応答時間 (秒)")
+    parser.add_argument('--ytdl-latency', type=float, default=0.5, help="yt-dlp スタブの抽出時間 (秒)")
+    parser.add_argument('--discord-latency', type=float, default=0.0, help="応答送信にかかる時間 (秒)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="結果を JSON で書き出すパス")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# ==========================================
+# 起動時の import 時間とメモリ (python -X importtime の集計)
+# ==========================================
+# python -m bench.startup
+# シナリオごとに新しいプロセスで import し、所要時間・最大 RSS・重い依存の読み込み有無・
+# import 時間の大きいモジュールを表示する。DB や Discord には接続しない。
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('numpy', 'pandas', 'sklearn', 'yt_dlp', 'psutil', 'psycopg2', 'requests')
+
+# 起動時に読み込まれるもの (bot.py と、有効な機能の cogs/ モジュール)
+STARTUP = "import bot, importlib\nfrom config import enabled_features\nfor f in enabled_features(): importlib.import_module(f'cogs.{f}')"
+SCENARIOS = {
+    'startup': (STARTUP, {}),
+    'startup (anime, reminders only)': (STARTUP, {'DISABLED_FEATURES': 'music,prediction'}),
+    # 初回利用時に読み込まれるもの
+    'music first use': (STARTUP + "\nsys.modules['cogs.music'].get_ytdl()", {}),
+    'compute worker': ("import analytics, price_model", {}),
+    # 以前の bot.py が先頭で読み込んでいたもの (入っていないものは飛ばす)
+    'old bot.py imports': ("import importlib\n"
+                           "for m in ('discord', 'psutil', 'requests', 'psycopg2', 'pandas', 'numpy', 'sklearn.ensemble', 'yt_dlp'):\n"
+                           "    try: importlib.import_module(m)\n"
+                           "    except ImportError: pass\n"
+                           "if 'yt_dlp' in sys.modules: sys.modules['yt_dlp'].YoutubeDL({'quiet': True})", {}),
+}
+
+PROBE = '''
+import sys, time, json, resource
+started = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+def parse_importtime(stderr, top):
+    # "import time: self [us] | cumulative | imported package" の行から、自身の import 時間が大きい順に並べる
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line: continue
+        own, _, name = line[len('import time:'):].split('|')
+        entries.append((int(own), name.strip()))
+    return sorted(entries, reverse=True)[:top]
+
+def measure(code, env=None, top=8):
+    """code を新しいプロセスで実行し、{'seconds', 'maxrss_kb', 'heavy', 'top'} を返す。"""
+    proc_env = {**os.environ, **(env or {})}
+    proc_env.setdefault('DISABLED_FEATURES', '')
+    script = PROBE.format(code=code, heavy=HEAVY_MODULES)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', script], cwd=ROOT, env=proc_env,
+                          capture_output=True, text=True, check=True)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['top'] = parse_importtime(proc.stderr, top)
+    return result
+
+def report(results):
+    print(f"{'scenario':<34} {'import ms':>10} {'max RSS MB':>11}  heavy modules")
+    for name, r in results.items():
+        print(f"{name:<34} {r['seconds'] * 1000:>10.0f} {r['maxrss_kb'] / 1024:>11.1f}  {', '.join(r['heavy']) or '-'}")
+    for name, r in results.items():
+        print(f"\n[{name}] slowest modules (self time)")
+        for us, module in r['top']:
+            print(f"  {us / 1000:>8.1f} ms  {module}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="シナリオごとの import 時間と RSS を表示します")
+    parser.add_argument('--top', type=int, default=8)
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS), help="省略時はすべて")
+    args = parser.parse_args()
+    report({name: measure(*SCENARIOS[name], top=args.top) for name in (args.scenario or SCENARIOS)})
@@ -1,239 +1,56 @@
-import os
 import discord
 from discord import app_commands
-from discord.ext import commands, tasks
-import psutil
-import requests
-import urllib.parse
-import psycopg2
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
-import pytz
-from sklearn.ensemble import RandomForestRegressor
-import asyncio
-from yt_dlp import YoutubeDL
-
-# --- Secrets ---
-DATABASE_URL = os.getenv('DATABASE_URL')
-DISCORD_BOT_TOKEN = os.getenv('DISCORD_BOT_TOKEN')
-ANNICT_TOKEN = os.getenv('ANNICT_TOKEN')
-YOUR_USER_ID = 1421704357983813744 
-
-# --- 基本設定 ---
-timezone_jp = pytz.timezone('Asia/Tokyo')
-start_time = datetime.now(timezone_jp)
+from discord.ext import commands
+from datetime import datetime
+from config import DISCORD_BOT_TOKEN, YOUR_USER_ID, SHARD_COUNT, SHARD_IDS, timezone_jp, start_time, enabled_features
+from db import init_db_pool, close_db_pool, init_db
+import metrics
+import stats
+from leader import LeaderElection
+from listener import NotifyListener
 
 intents = discord.Intents.default()
-intents.message_content = True 
-intents.members = True 
+intents.message_content = True
+intents.members = True
 
-class ChulyBot(commands.Bot):
+# シャード数が指定されていればシャーディングして動かす
+BotBase = commands.AutoShardedBot if SHARD_COUNT else commands.Bot
+
+class ChulyBot(BotBase):
     def __init__(self):
-        super().__init__(command_prefix="!", intents=intents)
+        shard_options = {'shard_count': SHARD_COUNT, 'shard_ids': SHARD_IDS} if SHARD_COUNT else {}
+        super().__init__(command_prefix="!", intents=intents, **shard_options)
+        self.metrics = metrics.MetricsService()
+        self.leader = LeaderElection()
+        self.listener = NotifyListener()
+        self.stats = stats.StatsSampler(self)
 
     async def setup_hook(self):
-        init_db()
-        self.check_reminders_task.start()
+        await self.metrics.start()
+        await init_db_pool()
+        await init_db()
+        await self.stats.start()
+        await self.listener.start()
+        # 機能ごとの拡張 (cogs/) を読み込む。重い依存は各機能の初回利用時に読み込まれる
+        for feature in enabled_features():
+            await self.load_extension(f"cogs.{feature}")
+        # 定期処理の担当は、各機能がリーダー変更の通知を受けて開始・停止する
+        await self.leader.start()
+
+    async def close(self):
+        await self.leader.stop()
+        for extension in list(self.extensions):
+            await self.unload_extension(extension)
+        await super().close()
+        await self.listener.stop()
+        await self.stats.stop()
+        await close_db_pool()
+        await self.metrics.stop()
 
 bot = ChulyBot()
 
 # ==========================================
-# 0. データベース操作
-# ==========================================
-def get_db_connection():
-    return psycopg2.connect(DATABASE_URL)
-
-def init_db():
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute('''CREATE TABLE IF NOT EXISTS history 
-                       (timestamp TIMESTAMPTZ, price FLOAT, month INT, day INT, hour INT, prediction_price FLOAT)''')
-        cur.execute('''CREATE TABLE IF NOT EXISTS reminders 
-                       (id SERIAL PRIMARY KEY, user_id BIGINT, time TIMESTAMPTZ, interval_weeks INT)''')
-    conn.commit()
-    conn.close()
-
-def save_price(price, pred_price=None):
-    now = datetime.now(timezone_jp)
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute("INSERT INTO history (timestamp, price, month, day, hour, prediction_price) VALUES (%s, %s, %s, %s, %s, %s)",
-                    (now, price, now.month, now.day, now.hour, pred_price))
-    conn.commit()
-    conn.close()
-
-def load_history():
-    conn = get_db_connection()
-    df = pd.read_sql_query("SELECT * FROM history ORDER BY timestamp ASC", conn)
-    conn.close()
-    return df
-
-def get_user_reminders(user_id):
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute("SELECT id, time, interval_weeks FROM reminders WHERE user_id = %s ORDER BY time ASC", (user_id,))
-        rows = cur.fetchall()
-    conn.close()
-    return rows
-
-# ==========================================
-# 1. AIロジック (株価予測)
-# ==========================================
-def get_full_analysis():
-    df = load_history()
-    if len(df) < 10: return f"蓄積中({len(df)}/10)", 0, 50, 0.0
-    df = df.copy()
-    df['ma5'] = df['price'].rolling(window=5, min_periods=1).mean()
-    df['deviation'] = (df['price'] - df['ma5']) / df['ma5'] * 100
-    df['momentum'] = df['price'].diff(3).fillna(0)
-    features = ['month', 'day', 'hour', 'deviation', 'momentum']
-    X = df[features].values
-    y = df['price'].values
-    try:
-        model = RandomForestRegressor(n_estimators=50, max_depth=7, random_state=42)
-        model.fit(X, y)
-        now = datetime.now(timezone_jp)
-        last_row = df.iloc[-1]
-        current_features = np.array([[now.month, now.day, now.hour, last_row['deviation'], last_row['momentum']]])
-        pred_raw = model.predict(current_features)[0]
-        delta = df['price'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=min(len(df), 14), min_periods=1).mean().iloc[-1]
-        loss = (-delta.where(delta < 0, 0)).rolling(window=min(len(df), 14), min_periods=1).mean().iloc[-1]
-        rsi = 100.0 - (100.0 / (1.0 + (gain / loss))) if loss != 0 else 50.0
-        diff = int(round(pred_raw - df['price'].iloc[-1]))
-        score = 0.0
-        if diff >= 1: score += 1.0
-        if rsi < 35: score += 1.5
-        if rsi > 65: score -= 1.5
-        if diff >= 5 or score >= 2.5: status = "強力な上昇サイン 🚀"
-        elif diff >= 1: status = "緩やかな上昇見込み 📈"
-        elif diff <= -5 or score <= -2.5: status = "下落注意 📉"
-        else: status = "方向感の探り合い ➡️"
-        return status, diff, int(round(rsi)), score
-    except: return "AI調整中", 0, 50, 0.0
-
-# --- 音楽再生用の設定 ---
-YTDL_OPTIONS = {
-    'cookiefile': 'cookies.txt',
-    # 'bestaudio/best' だけでなく、ストリーミングに強い m4a や 
-    # YouTubeが提供する「一番軽い音声形式」を優先的に探す設定
-    'format': 'bestaudio[ext=m4a]/bestaudio/best',
-    'extractaudio': True,
-    'audioformat': 'mp3',
-    'outtmpl': '%(extractor)s-%(id)s-%(title)s.%(ext)s',
-    'restrictfilenames': True,
-    'noplaylist': True,
-    'nocheckcertificate': True,
-    'ignoreerrors': False,
-    'logtostderr': False,
-    'quiet': True,
-    'no_warnings': True,
-    'default_search': 'auto',
-    'source_address': '0.0.0.0',
-    # ストリーミング時の403エラーを避けるための追加オプション
-    'force_generic_extractor': False,
-}
-
-FFMPEG_OPTIONS = {
-    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
-    'options': '-vn',
-}
-
-ytdl = YoutubeDL(YTDL_OPTIONS)
-
-class YTDLSource(discord.PCMVolumeTransformer):
-    def __init__(self, source, *, data, volume=0.5):
-        super().__init__(source, volume)
-        self.data = data
-        self.title = data.get('title')
-        self.url = data.get('url')
-
-    @classmethod
-    async def from_url(cls, url, *, loop=None, stream=True):
-        loop = loop or asyncio.get_event_loop()
-        # extract_info を非同期で実行してボットを止めないようにする
-        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=not stream))
-        
-        if 'entries' in data:
-            data = data['entries'][0]
-
-        filename = data['url'] if stream else ytdl.prepare_filename(data)
-        return cls(discord.FFmpegPCMAudio(filename, **FFMPEG_OPTIONS), data=data)
-
-# --- 音楽コマンドセクション ---
-
-@bot.tree.command(name="music", description="音楽を再生します")
-@app_commands.describe(query="曲名またはYouTubeのURL")
-async def music(interaction: discord.Interaction, query: str):
-    # ユーザーがボイスチャンネルにいるか確認
-    if interaction.user.voice is None:
-        return await interaction.response.send_message("⚠️ ボイスチャンネルに接続してから使用してください。", ephemeral=True)
-
-    await interaction.response.defer() # 取得に時間がかかる場合があるため
-
-    try:
-        # ボイスチャンネルに接続（未接続なら接続、接続済みなら移動）
-        channel = interaction.user.voice.channel
-        if interaction.guild.voice_client is None:
-            vc = await channel.connect()
-        else:
-            vc = interaction.guild.voice_client
-            if vc.channel.id != channel.id:
-                await vc.move_to(channel)
-
-        # 再生中の場合は停止
-        if vc.is_playing():
-            vc.stop()
-
-        # YouTubeからソースを取得
-        player = await YTDLSource.from_url(query, loop=bot.loop, stream=True)
-        
-        # 再生開始
-        vc.play(player, after=lambda e: print(f'Player error: {e}') if e else None)
-
-        await interaction.followup.send(f"🎵 再生中: **{player.title}**")
-
-    except Exception as e:
-        await interaction.followup.send(f"❌ エラーが発生しました: {e}")
-
-@bot.tree.command(name="stop", description="音楽を停止してボイスチャンネルから退出します")
-async def stop(interaction: discord.Interaction):
-    if interaction.guild.voice_client:
-        await interaction.guild.voice_client.disconnect()
-        await interaction.response.send_message("👋 退出しました。")
-    else:
-        await interaction.response.send_message("⚠️ ボットはボイスチャンネルにいません。", ephemeral=True)
-
-# ==========================================
-# 2. リマインダー監視タスク
-# ==========================================
-@tasks.loop(seconds=5.0)
-async def check_reminders_task():
-    now = datetime.now(timezone_jp)
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute("SELECT id, user_id, time, interval_weeks FROM reminders WHERE time <= %s", (now,))
-        due = cur.fetchall()
-        for r_id, u_id, r_time, interval in due:
-            user = bot.get_user(u_id)
-            if user:
-                embed = discord.Embed(title="⏰ 通知", description="お約束の時間です。ご確認をお願いします。", color=0xff0000)
-                embed.set_footer(text=f"設定: {r_time.astimezone(timezone_jp).strftime('%H:%M:%S')}")
-                try: await user.send(content=f"{user.mention}", embed=embed)
-                except: pass
-            
-            if interval > 0:
-                next_time = r_time + timedelta(hours=interval)
-                cur.execute("UPDATE reminders SET time = %s WHERE id = %s", (next_time, r_id))
-            else:
-                cur.execute("DELETE FROM reminders WHERE id = %s", (r_id,))
-    conn.commit()
-    conn.close()
-bot.check_reminders_task = check_reminders_task
-
-# ==========================================
-# 3. イベント
+# イベント
 # ==========================================
 @bot.event
 async def on_ready():
@@ -242,81 +59,18 @@ async def on_ready():
     print(f"✅ Online: {bot.user}")
 
 # ==========================================
-# 4. スラッシュコマンド
+# スラッシュコマンド
 # ==========================================
 
-# --- リマインダー ---
-@bot.tree.command(name="remind", description="指定日時に通知を設定します")
-@app_commands.describe(date="YYYY/MM/DD", time="HH:MM:SS")
-async def remind(interaction: discord.Interaction, date: str, time: str):
-    user_reminders = get_user_reminders(interaction.user.id)
-    if len(user_reminders) >= 3: return await interaction.response.send_message("⚠️ 最大3件までです。", ephemeral=True)
-    try:
-        dt = timezone_jp.localize(datetime.strptime(f"{date} {time}", "%Y/%m/%d %H:%M:%S"))
-        if dt < datetime.now(timezone_jp): return await interaction.response.send_message("⚠️ 過去の時間は設定できません。", ephemeral=True)
-        conn = get_db_connection(); cur = conn.cursor()
-        cur.execute("INSERT INTO reminders (user_id, time, interval_weeks) VALUES (%s, %s, %s)", (interaction.user.id, dt, 0))
-        conn.commit(); conn.close()
-        await interaction.response.send_message(f"✅ 設定完了: {date} {time}")
-    except: await interaction.response.send_message("⚠️ 形式エラー (2026/01/01 12:00:00)", ephemeral=True)
-
-@bot.tree.command(name="remind_repeat", description="一定間隔で通知を設定します")
-@app_commands.describe(interval="間隔（数字）", unit="単位", time="基準時刻 HH:MM:SS")
-@app_commands.choices(unit=[
-    app_commands.Choice(name="週間おき", value="weeks"),
-    app_commands.Choice(name="時間おき", value="hours")
-])
-async def remind_repeat(interaction: discord.Interaction, interval: int, unit: app_commands.Choice[str], time: str):
-    user_reminders = get_user_reminders(interaction.user.id)
-    if len(user_reminders) >= 3: 
-        return await interaction.response.send_message("⚠️ 最大3件までです。", ephemeral=True)
-    
-    try:
-        now = datetime.now(timezone_jp)
-        t = datetime.strptime(time, "%H:%M:%S").time()
-        target_dt = timezone_jp.localize(datetime.combine(now.date(), t))
-        
-        interval_in_hours = interval if unit.value == "hours" else interval * 168
-        
-        if target_dt < now:
-            target_dt += timedelta(hours=interval_in_hours)
-        
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("INSERT INTO reminders (user_id, time, interval_weeks) VALUES (%s, %s, %s)", 
-                    (interaction.user.id, target_dt, interval_in_hours))
-        conn.commit()
-        conn.close()
-        
-        await interaction.response.send_message(f"✅ 繰り返し設定完了: {interval}{unit.name} (初回: {target_dt.strftime('%m/%d %H:%M')})")
-    except:
-        await interaction.response.send_message("⚠️ 形式エラー (例: 09:00:00)", ephemeral=True)
-
-@bot.tree.command(name="remindlist", description="現在設定中の通知を確認します")
-async def remindlist(interaction: discord.Interaction):
-    data = get_user_reminders(interaction.user.id)
-    if not data: return await interaction.response.send_message("🔔 設定中の通知はありません。", ephemeral=True)
-    embed = discord.Embed(title="🔔 通知リスト", color=0x3498db)
-    for i, r in enumerate(data):
-        cycle = f" ({r[2]}週間おき)" if r[2] > 0 else " (一度限り)"
-        embed.add_field(name=f"No.{i+1}", value=f"時間: {r[1].astimezone(timezone_jp).strftime('%Y/%m/%d %H:%M')}{cycle}", inline=False)
-    await interaction.response.send_message(embed=embed, ephemeral=True)
-
-@bot.tree.command(name="remindstop", description="すべての通知をオフにします")
-async def remindstop(interaction: discord.Interaction):
-    conn = get_db_connection(); cur = conn.cursor()
-    cur.execute("DELETE FROM reminders WHERE user_id = %s", (interaction.user.id,))
-    conn.commit(); conn.close()
-    await interaction.response.send_message("✅ すべて削除しました。")
-
 # --- 計算機能 ---
 @bot.tree.command(name="calculation", description="簡単な計算を行います")
 @app_commands.choices(op=[
-    app_commands.Choice(name="+", value="+"), 
-    app_commands.Choice(name="-", value="-"), 
-    app_commands.Choice(name="*", value="*"), 
+    app_commands.Choice(name="+", value="+"),
+    app_commands.Choice(name="-", value="-"),
+    app_commands.Choice(name="*", value="*"),
     app_commands.Choice(name="/", value="/")
 ])
+@metrics.command("calculation")
 async def calculation(interaction: discord.Interaction, num1: float, op: str, num2: float):
     try:
         if op == '+': res = num1 + num2
@@ -326,55 +80,39 @@ async def calculation(interaction: discord.Interaction, num1: float, op: str, nu
         await interaction.response.send_message(f"🧮 結果: `{num1} {op} {num2} = {res}`")
     except: await interaction.response.send_message("エラーが発生しました")
 
-# --- 株価予測 ---
-@bot.tree.command(name="prediction", description="カカポの株価を予測します")
-async def prediction(interaction: discord.Interaction, price: int):
-    if interaction.user.id != YOUR_USER_ID: return await interaction.response.send_message("⚠️ 開発者専用", ephemeral=True)
-    await interaction.response.defer()
-    status, diff, rsi, score = get_full_analysis()
-    predicted_next = float(price + diff)
-    save_price(float(price), predicted_next)
-    embed = discord.Embed(title="🕊️ カカポ株価　AI診断", description=f"最新価格 **{price}** を分析しました。", color=0x5865F2)
-    embed.add_field(name="🤖 総合判定", value=f"**{status}**", inline=False)
-    embed.add_field(name="🎯 次回予測価格", value=f"{int(predicted_next)}", inline=True)
-    embed.add_field(name="🌡️ RSI (熱感)", value=f"{rsi}%", inline=True)
-    embed.add_field(name="📈 変動幅予想", value=f"{diff:+d}", inline=True)
-    embed.add_field(name="📊 AIスコア", value=f"{score:+.1f}", inline=True)
-    embed.add_field(name="📚 蓄積データ", value=f"{len(load_history())} 件", inline=True)
-    embed.set_footer(text="AI学習式株価予測")
-    await interaction.followup.send(embed=embed)
-
-@bot.tree.command(name="show_data", description="データの保存履歴と的中判定を表示します")
-async def show_data(interaction: discord.Interaction):
-    df = load_history()
-    if df.empty: return await interaction.response.send_message("📚 データなし")
-    lines = []
-    display_df = df.iloc[::-1].head(10)
-    for i, row in enumerate(display_df.itertuples()):
-        ts = row.timestamp.astimezone(timezone_jp).strftime('%m/%d %H:%M')
-        hit_mark = ""
-        if i > 0 and i + 1 < len(display_df):
-            prev = display_df.iloc[i+1]
-            if getattr(prev, 'prediction_price', None) is not None:
-                hit_mark = " ✅" if int(round(float(row.price))) == int(round(float(prev.prediction_price))) else " ❌"
-        lines.append(f"📁 {ts} | 価格: **{int(row.price)}**{hit_mark}{' (結果待ち)' if i == 0 else ''}")
-    await interaction.response.send_message(embed=discord.Embed(title="📚 最新10件の履歴と的中判定", description="\n".join(lines), color=0x2ecc71))
-
 @bot.tree.command(name="status", description="Botの稼働状況を確認します")
+@metrics.command("status")
 async def status(interaction: discord.Interaction):
+    # 値はバックグラウンドで採取済みのものを表示するだけ (ここでは計測しない)
     uptime = datetime.now(timezone_jp) - start_time
-    cpu = psutil.cpu_percent(); mem = psutil.virtual_memory()
+    sample = bot.stats.latest
     embed = discord.Embed(title="📊 Bot システムステータス", color=0x3498db)
     embed.add_field(name="🟢 状態", value="**オンライン (正常稼働中)**", inline=False)
     embed.add_field(name="⏱️ 稼働時間", value=f"`{str(uptime).split('.')[0]}`", inline=True)
     embed.add_field(name="📡 Ping", value=f"`{round(bot.latency * 1000)}ms`", inline=True)
-    embed.add_field(name="🖥️ CPU/RAM", value=f"{cpu}% / {mem.percent}%", inline=True)
-    embed.add_field(name="📚 蓄積データ", value=f"**{len(load_history())} 件**", inline=True)
+    if sample is None:
+        embed.add_field(name="🖥️ CPU/RSS", value="計測中…", inline=True)
+    else:
+        embed.add_field(name="🖥️ CPU/RSS", value=f"{sample['cpu']:.1f}% / {sample['rss'] / 1024 ** 2:.0f}MB\n{stats.sparkline(bot.stats.series('cpu'))}", inline=True)
+        embed.add_field(name="📚 蓄積データ", value=f"**{sample['history']} 件**", inline=True)
+        embed.add_field(name="🔊 ボイス接続", value=f"{sample['voice_clients']} 件", inline=True)
+        if sample['pool_size'] is not None:
+            embed.add_field(name="🗄️ DB接続", value=f"{sample['pool_used']} / {sample['pool_size']} 使用中", inline=True)
+    prediction = bot.get_cog('Prediction')
+    if prediction is not None:
+        compute = prediction.compute_executor
+        embed.add_field(name="🧮 計算キュー", value=f"{compute.pending} 件 / 直近 {compute.last_compute_ms:.0f}ms", inline=True)
+    embed.add_field(name="🐢 ループ遅延", value=f"{metrics.last_loop_lag * 1000:.1f}ms\n{stats.sparkline(bot.stats.series('loop_lag'))}", inline=True)
+    latencies = metrics.command_percentiles()
+    if latencies:
+        lines = [f"`/{name}` {p50 * 1000:.0f} / {p95 * 1000:.0f} / {p99 * 1000:.0f}ms" for name, p50, p95, p99 in latencies]
+        embed.add_field(name="⏱️ 応答時間 (p50 / p95 / p99)", value="\n".join(lines), inline=False)
     await interaction.response.send_message(embed=embed)
 
 # --- チャンネルリセット ---
 @bot.tree.command(name="nuke", description="チャンネルをリセットします")
 @app_commands.describe(channel_id="リセットしたいチャンネルのIDを入力してください")
+@metrics.command("nuke")
 async def nuke(interaction: discord.Interaction, channel_id: str):
     if interaction.user.id != YOUR_USER_ID: return await interaction.response.send_message("⚠️ 開発者専用", ephemeral=True)
     await interaction.response.defer(ephemeral=True)
@@ -387,34 +125,5 @@ async def nuke(interaction: discord.Interaction, channel_id: str):
         await new_ch.send("💥 チャンネルがリセットされました。")
     except Exception as e: await interaction.followup.send(f"❌ エラー: {e}")
 
-# --- アニメ ---
-@bot.tree.command(name="anime", description="今期の人気アニメを表示します")
-@app_commands.choices(season=[
-    app_commands.Choice(name="🌸 春", value="spring"), 
-    app_commands.Choice(name="☀️ 夏", value="summer"), 
-    app_commands.Choice(name="🍂 秋", value="fall"), 
-    app_commands.Choice(name="❄️ 冬", value="winter")
-])
-async def anime(interaction: discord.Interaction, season: app_commands.Choice[str]):
-    await interaction.response.defer()
-    res = requests.get("https://api.annict.com/v1/works", params={'access_token': ANNICT_TOKEN, 'filter_season': f"2026-{season.value}", 'sort_watchers_count': 'desc', 'per_page': 10}).json()
-    works = res.get('works', [])
-    if not works: return await interaction.followup.send("⚠️ データなし")
-    await interaction.followup.send(embeds=[discord.Embed(title=f"{i+1}. {w['title']}", url=w.get('official_site_url'), color=0x3498db) for i, w in enumerate(works)])
-
-@bot.tree.command(name="service", description="アニメ作品を検索します")
-async def service(interaction: discord.Interaction, work_name: str):
-    res = requests.get("https://api.annict.com/v1/works", params={'access_token': ANNICT_TOKEN, 'filter_title': work_name, 'per_page': 3}).json()
-    works = res.get('works', [])
-    if not works: return await interaction.response.send_message("⚠️ なし")
-    await interaction.response.send_message(embeds=[discord.Embed(title=w['title'], description=f"[Google検索](https://www.google.com/search?q={urllib.parse.quote(w['title'])}+アニメ)", color=0xe74c3c) for w in works])
-
-@bot.tree.command(name="delete_latest", description="最新のデータを一件削除します")
-async def delete_latest(interaction: discord.Interaction):
-    if interaction.user.id != YOUR_USER_ID: return
-    conn = get_db_connection(); cur = conn.cursor()
-    cur.execute("DELETE FROM history WHERE timestamp = (SELECT MAX(timestamp) FROM history)")
-    cnt = cur.rowcount; conn.commit(); conn.close()
-    await interaction.response.send_message("✅ 削除成功" if cnt > 0 else "⚠️ データなし")
-
-bot.run(DISCORD_BOT_TOKEN)
+if __name__ == '__main__':
+    bot.run(DISCORD_BOT_TOKEN)
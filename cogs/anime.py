@@ -0,0 +1,45 @@
+import urllib.parse
+import discord
+from discord import app_commands
+from discord.ext import commands
+import metrics
+import annict
+from config import ANNICT_TOKEN
+
+# ==========================================
+# アニメ
+# ==========================================
+class Anime(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.annict_client = annict.AnnictClient(ANNICT_TOKEN)
+
+    async def cog_unload(self):
+        await self.annict_client.close()
+
+    @app_commands.command(name="anime", description="今期の人気アニメを表示します")
+    @app_commands.choices(season=[
+        app_commands.Choice(name="🌸 春", value="spring"), 
+        app_commands.Choice(name="☀️ 夏", value="summer"), 
+        app_commands.Choice(name="🍂 秋", value="fall"), 
+        app_commands.Choice(name="❄️ 冬", value="winter")
+    ])
+    @metrics.command("anime")
+    async def anime(self, interaction: discord.Interaction, season: app_commands.Choice[str]):
+        await interaction.response.defer()
+        try: works = await self.annict_client.season_ranking(f"2026-{season.value}")
+        except Exception: return await interaction.followup.send("⚠️ 取得に失敗しました")
+        if not works: return await interaction.followup.send("⚠️ データなし")
+        await interaction.followup.send(embeds=[discord.Embed(title=f"{i+1}. {w['title']}", url=w.get('official_site_url'), color=0x3498db) for i, w in enumerate(works)])
+
+    @app_commands.command(name="service", description="アニメ作品を検索します")
+    @metrics.command("service")
+    async def service(self, interaction: discord.Interaction, work_name: str):
+        await interaction.response.defer()
+        try: works = await self.annict_client.search(work_name)
+        except Exception: return await interaction.followup.send("⚠️ 取得に失敗しました")
+        if not works: return await interaction.followup.send("⚠️ なし")
+        await interaction.followup.send(embeds=[discord.Embed(title=w['title'], description=f"[Google検索](https://www.google.com/search?q={urllib.parse.quote(w['title'])}+アニメ)", color=0xe74c3c) for w in works])
+
+async def setup(bot):
+    await bot.add_cog(Anime(bot))
@@ -0,0 +1,350 @@
+import os
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import urllib.parse
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import discord
+from discord import app_commands
+from discord.ext import commands
+import metrics
+
+# ==========================================
+# 音楽再生
+# ==========================================
+YTDL_OPTIONS = {
+    'cookiefile': 'cookies.txt',
+    # 'bestaudio/best' だけでなく、ストリーミングに強い m4a や 
+    # YouTubeが提供する「一番軽い音声形式」を優先的に探す設定
+    'format': 'bestaudio[ext=m4a]/bestaudio/best',
+    'extractaudio': True,
+    'audioformat': 'mp3',
+    'outtmpl': '%(extractor)s-%(id)s-%(title)s.%(ext)s',
+    'restrictfilenames': True,
+    'noplaylist': True,
+    'nocheckcertificate': True,
+    'ignoreerrors': False,
+    'logtostderr': False,
+    'quiet': True,
+    'no_warnings': True,
+    'default_search': 'auto',
+    'source_address': '0.0.0.0',
+    # ストリーミング時の403エラーを避けるための追加オプション
+    'force_generic_extractor': False,
+}
+
+FFMPEG_OPTIONS = {
+    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
+    'options': '-vn',
+}
+
+# yt-dlp は読み込みが重いので、最初に使うときに import して YoutubeDL を作る
+_ytdl = None
+
+def get_ytdl():
+    global _ytdl
+    if _ytdl is None:
+        from yt_dlp import YoutubeDL
+        _ytdl = YoutubeDL(YTDL_OPTIONS)
+    return _ytdl
+
+# 抽出は共有のデフォルト executor ではなく、専用の上限付きスレッドプールで行う
+YTDL_WORKERS = int(os.getenv('YTDL_WORKERS', '2'))
+ytdl_executor = ThreadPoolExecutor(max_workers=YTDL_WORKERS, thread_name_prefix='ytdl')
+
+# --- yt-dlp 抽出結果のキャッシュ ---
+YTDL_CACHE_SIZE = int(os.getenv('YTDL_CACHE_SIZE', '128'))
+# 署名付き URL に expire が無い場合の有効期限 (秒)
+YTDL_CACHE_TTL = float(os.getenv('YTDL_CACHE_TTL', '1800'))
+# 指定した場合は SQLite に保存し、再起動後も使う
+YTDL_CACHE_PATH = os.getenv('YTDL_CACHE_PATH')
+# 期限ぎりぎりの URL で再生を始めないための余裕 (秒)
+YTDL_EXPIRE_MARGIN = 300
+# ストリーミング再生に必要な項目だけを保存する
+YTDL_CACHED_FIELDS = ('id', 'title', 'url', 'webpage_url', 'duration', 'ext')
+
+def ytdl_cache_key(query):
+    # 同じ動画の URL の書き方の違いは動画 ID にまとめる
+    query = query.strip()
+    parsed = urllib.parse.urlparse(query)
+    host = (parsed.hostname or '').lower()
+    if host.endswith('youtu.be'):
+        return f"yt:{parsed.path.strip('/')}"
+    if host.endswith('youtube.com'):
+        v = urllib.parse.parse_qs(parsed.query).get('v')
+        if v: return f"yt:{v[0]}"
+        if parsed.path.startswith('/shorts/'): return f"yt:{parsed.path.split('/')[2]}"
+    if parsed.scheme: return query
+    return f"search:{' '.join(query.lower().split())}"
+
+def ytdl_expires_at(data):
+    now = time.time()
+    expire = urllib.parse.parse_qs(urllib.parse.urlparse(data.get('url') or '').query).get('expire')
+    if expire and expire[0].isdigit():
+        return min(int(expire[0]) - YTDL_EXPIRE_MARGIN, now + YTDL_CACHE_TTL)
+    return now + YTDL_CACHE_TTL
+
+class ExtractionCache:
+    """抽出結果の TTL + LRU キャッシュ。同じキーの同時リクエストは1回の抽出にまとめる。"""
+    def __init__(self, maxsize, path=None):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()   # key -> (expires_at, data)
+        self._inflight = {}
+        self._db = None
+        self._db_lock = threading.Lock()
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS ytdl_cache (key TEXT PRIMARY KEY, expires_at REAL, data TEXT)")
+            self._db.execute("DELETE FROM ytdl_cache WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+            rows = self._db.execute("SELECT key, expires_at, data FROM ytdl_cache ORDER BY expires_at DESC LIMIT ?", (maxsize,)).fetchall()
+            for key, expires_at, data in reversed(rows):
+                self._entries[key] = (expires_at, json.loads(data))
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None: return None
+        if entry[0] <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _put(self, keys, expires_at, data):
+        for key in keys:
+            self._entries[key] = (expires_at, data)
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _persist(self, keys, expires_at, data):
+        # 抽出スレッド上で呼ばれる
+        if self._db is None: return
+        with self._db_lock:
+            self._db.executemany("INSERT OR REPLACE INTO ytdl_cache (key, expires_at, data) VALUES (?, ?, ?)",
+                                 [(key, expires_at, json.dumps(data)) for key in keys])
+            self._db.commit()
+
+    @metrics.subsystem('ytdl.extract_info')
+    def _extract(self, query, key):
+        data = get_ytdl().extract_info(query, download=False)
+        if 'entries' in data:
+            data = data['entries'][0]
+        data = {k: data.get(k) for k in YTDL_CACHED_FIELDS}
+        keys = [key]
+        # 検索語で引いた場合も、動画 ID でも引けるようにしておく
+        if data.get('id') and not key.startswith('yt:') and 'youtube' in (data.get('webpage_url') or ''):
+            keys.append(f"yt:{data['id']}")
+        expires_at = ytdl_expires_at(data)
+        self._persist(keys, expires_at, data)
+        return keys, expires_at, data
+
+    async def extract(self, query, loop):
+        key = ytdl_cache_key(query)
+        data = self.get(key)
+        if data is not None: return data
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = loop.run_in_executor(ytdl_executor, self._extract, query, key)
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+        keys, expires_at, data = await asyncio.shield(fut)
+        self._put(keys, expires_at, data)
+        return data
+
+ytdl_cache = ExtractionCache(YTDL_CACHE_SIZE, YTDL_CACHE_PATH)
+
+class YTDLSource(discord.PCMVolumeTransformer):
+    def __init__(self, source, *, data, volume=0.5):
+        super().__init__(source, volume)
+        self.data = data
+        self.title = data.get('title')
+        self.url = data.get('url')
+        self.ttfa_ms = None
+
+    @classmethod
+    @metrics.subsystem('ytdl.from_url')
+    async def from_url(cls, url, *, loop=None, stream=True):
+        loop = loop or asyncio.get_event_loop()
+        # extract_info を非同期で実行してボットを止めないようにする
+        if stream:
+            # ストリーミングは URL だけあれば良いのでキャッシュを使う
+            data = await ytdl_cache.extract(url, loop)
+            return cls(discord.FFmpegPCMAudio(data['url'], **FFMPEG_OPTIONS), data=data)
+
+        data = await loop.run_in_executor(ytdl_executor, lambda: get_ytdl().extract_info(url, download=True))
+        if 'entries' in data:
+            data = data['entries'][0]
+        return cls(discord.FFmpegPCMAudio(get_ytdl().prepare_filename(data), **FFMPEG_OPTIONS), data=data)
+
+# --- 再生キュー ---
+class GuildPlayer:
+    """ギルドごとの再生キュー。再生中に次の曲の URL 解決と FFmpeg の起動を済ませておく。"""
+    def __init__(self, guild, loop):
+        self.guild = guild
+        self.loop = loop
+        self.queue = deque()      # (query, 要求時刻)
+        self.current = None
+        self.recent = deque(maxlen=10)  # (曲名, 再生開始までの ms)
+        self.last_error = None
+        self._prefetch = None     # (キューの要素, 取得中のタスク)
+        self._ended_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def enqueue(self, query):
+        entry = (query, time.perf_counter())
+        self.queue.append(entry)
+        return entry
+
+    def prefetch(self):
+        # キュー先頭の曲を先に取得しておく (FFmpegPCMAudio は生成時にプロセスを起動する)
+        if self._prefetch is None and self.queue:
+            entry = self.queue[0]
+            self._prefetch = (entry, asyncio.create_task(YTDLSource.from_url(entry[0], loop=self.loop, stream=True)))
+
+    def _drop_prefetch(self):
+        if self._prefetch is None: return
+        task = self._prefetch[1]
+        self._prefetch = None
+        if not task.done(): task.cancel()
+        elif not task.cancelled() and task.exception() is None: task.result().cleanup()
+
+    def clear(self):
+        self.queue.clear()
+        self._drop_prefetch()
+
+    def _after(self, error):
+        # 音声スレッドから呼ばれるので、ループ側で次の曲を始める
+        if error: print(f'Player error: {error}')
+        self._ended_at = time.perf_counter()
+        asyncio.run_coroutine_threadsafe(self.play_next(), self.loop)
+
+    async def play_next(self):
+        async with self._lock:
+            vc = self.guild.voice_client
+            if vc is None or vc.is_playing() or vc.is_paused(): return None
+            self.current = None
+            while self.queue:
+                entry = self.queue.popleft()
+                if self._prefetch is not None and self._prefetch[0] is entry:
+                    pending, self._prefetch = self._prefetch[1], None
+                else:
+                    self._drop_prefetch()
+                    pending = YTDLSource.from_url(entry[0], loop=self.loop, stream=True)
+                try:
+                    source = await pending
+                except Exception as e:
+                    self.last_error = e
+                    print(f'Player error: {e}')
+                    continue
+                # 要求時刻 (前の曲の再生中に要求された場合はその曲の終了時刻) から再生開始までの時間
+                source.ttfa_ms = (time.perf_counter() - max(entry[1], self._ended_at)) * 1000
+                vc.play(source, after=self._after)
+                self.current = source
+                self.recent.append((source.title, source.ttfa_ms))
+                self.prefetch()
+                return source
+            return None
+
+class Music(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.players = {}
+
+    def get_player(self, guild):
+        if guild.id not in self.players:
+            self.players[guild.id] = GuildPlayer(guild, self.bot.loop)
+        return self.players[guild.id]
+
+    async def cog_unload(self):
+        for player in self.players.values():
+            player.clear()
+        self.players.clear()
+
+    @app_commands.command(name="music", description="音楽を再生します")
+    @app_commands.describe(query="曲名またはYouTubeのURL")
+    @metrics.command("music")
+    async def music(self, interaction: discord.Interaction, query: str):
+        # ユーザーがボイスチャンネルにいるか確認
+        if interaction.user.voice is None:
+            return await interaction.response.send_message("⚠️ ボイスチャンネルに接続してから使用してください。", ephemeral=True)
+
+        await interaction.response.defer() # 取得に時間がかかる場合があるため
+
+        try:
+            # ボイスチャンネルに接続（未接続なら接続、接続済みなら移動）
+            channel = interaction.user.voice.channel
+            if interaction.guild.voice_client is None:
+                vc = await channel.connect()
+            else:
+                vc = interaction.guild.voice_client
+                if vc.channel.id != channel.id:
+                    await vc.move_to(channel)
+
+            player = self.get_player(interaction.guild)
+            entry = player.enqueue(query)
+
+            # 再生中ならキューに積み、次の曲として先読みしておく
+            if not (vc.is_playing() or vc.is_paused()):
+                source = await player.play_next()
+                # キューから消えていれば、この曲が再生されたか取得に失敗したかのどちらか
+                if entry not in player.queue:
+                    if source is None:
+                        return await interaction.followup.send(f"❌ エラーが発生しました: {player.last_error}")
+                    return await interaction.followup.send(f"🎵 再生中: **{source.title}** (開始まで {source.ttfa_ms:.0f}ms)")
+            player.prefetch()
+            await interaction.followup.send(f"📝 キューに追加しました: **{query}** (待ち {len(player.queue)} 曲)")
+
+        except Exception as e:
+            await interaction.followup.send(f"❌ エラーが発生しました: {e}")
+
+    @app_commands.command(name="skip", description="再生中の曲をスキップします")
+    @metrics.command("skip")
+    async def skip(self, interaction: discord.Interaction):
+        vc = interaction.guild.voice_client
+        if vc is None or not (vc.is_playing() or vc.is_paused()):
+            return await interaction.response.send_message("⚠️ 再生中の曲はありません。", ephemeral=True)
+        # 停止すると after コールバックから次の曲が始まる
+        vc.stop()
+        await interaction.response.send_message("⏭️ スキップしました。")
+
+    @app_commands.command(name="queue", description="再生待ちの曲を表示します")
+    @metrics.command("queue")
+    async def queue(self, interaction: discord.Interaction):
+        player = self.players.get(interaction.guild.id)
+        if player is None or (player.current is None and not player.queue):
+            return await interaction.response.send_message("📭 キューは空です。", ephemeral=True)
+        lines = [f"▶️ **{player.current.title}**"] if player.current else []
+        lines += [f"{i+1}. {query}" for i, (query, _) in enumerate(player.queue)]
+        await interaction.response.send_message(embed=discord.Embed(title="🎶 再生キュー", description="\n".join(lines), color=0x9b59b6))
+
+    @app_commands.command(name="nowplaying", description="再生中の曲を表示します")
+    @metrics.command("nowplaying")
+    async def nowplaying(self, interaction: discord.Interaction):
+        player = self.players.get(interaction.guild.id)
+        if player is None or player.current is None:
+            return await interaction.response.send_message("⚠️ 再生中の曲はありません。", ephemeral=True)
+        embed = discord.Embed(title="🎵 再生中", description=f"**{player.current.title}**", color=0x9b59b6)
+        embed.add_field(name="⚡ 再生開始まで", value=f"{player.current.ttfa_ms:.0f}ms", inline=True)
+        avg = sum(ms for _, ms in player.recent) / len(player.recent)
+        embed.add_field(name="📈 直近平均", value=f"{avg:.0f}ms ({len(player.recent)} 曲)", inline=True)
+        embed.add_field(name="📝 待ち", value=f"{len(player.queue)} 曲", inline=True)
+        await interaction.response.send_message(embed=embed)
+
+    @app_commands.command(name="stop", description="音楽を停止してボイスチャンネルから退出します")
+    @metrics.command("stop")
+    async def stop(self, interaction: discord.Interaction):
+        player = self.players.pop(interaction.guild.id, None)
+        if player is not None:
+            player.clear()
+        if interaction.guild.voice_client:
+            await interaction.guild.voice_client.disconnect()
+            await interaction.response.send_message("👋 退出しました。")
+        else:
+            await interaction.response.send_message("⚠️ ボットはボイスチャンネルにいません。", ephemeral=True)
+
+async def setup(bot):
+    await bot.add_cog(Music(bot))
@@ -0,0 +1,274 @@
+import os
+import asyncio
+import time
+import multiprocessing
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import discord
+from discord import app_commands
+from discord.ext import commands, tasks
+import analytics
+from config import YOUR_USER_ID, timezone_jp
+from db import (HISTORY_CHANNEL, INSTANCE_ID, BACKFILL_FEATURES_SQL, get_db_connection, get_history_count, adjust_history_count,
+                reset_history_count, load_history_tail, notify_history, parse_history_payload)
+import metrics
+
+# ==========================================
+# AIロジック (株価予測)
+# ==========================================
+# 計算 (学習・予測) の待ち時間の上限 (秒) / 定期再学習の間隔 (分)
+COMPUTE_TIMEOUT = float(os.getenv('COMPUTE_TIMEOUT', '60'))
+MODEL_REFIT_MINUTES = float(os.getenv('MODEL_REFIT_MINUTES', '60'))
+# スナップショットへ差分を読み込むときの1回あたりの行数
+HISTORY_LOAD_CHUNK = int(os.getenv('HISTORY_LOAD_CHUNK', '50000'))
+
+class ComputeExecutor:
+    """学習・予測を専用プロセスで実行し、イベントループを止めないようにする。
+
+    ワーカーは1つだけで、モデルと履歴をプロセス内に保持し続ける (毎回の再構築をしない)。
+    同じキーの計算が実行中なら、新しく投げずにその結果を待つ。
+    """
+    def __init__(self):
+        self._executor = None
+        self._inflight = {}
+        self.pending = 0
+        self.last_compute_ms = 0.0
+        self.on_restart = None
+
+    def start(self):
+        # ワーカープロセスは最初の計算要求時に起動される
+        self._executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'), initializer=analytics.worker_init)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _submit(self, fn, *args):
+        self.pending += 1
+        started = time.perf_counter()
+        executor = self._executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            # ワーカーが落ちた場合は作り直し、保持していた状態は読み直させる。
+            # 実行中だった計算はすべて同じ例外で返ってくるので、作り直すのは壊れたプールに対して一度だけ
+            if self._executor is executor:
+                self.shutdown(); self.start()
+                if self.on_restart: self.on_restart()
+            raise
+        finally:
+            self.pending -= 1
+            elapsed = time.perf_counter() - started
+            self.last_compute_ms = elapsed * 1000
+            metrics.observe('subsystem', f'compute.{fn.__name__}', elapsed)
+
+    async def run(self, key, fn, *args):
+        fut = self._inflight.get(key) if key else None
+        if fut is None:
+            fut = asyncio.ensure_future(self._submit(fn, *args))
+            if key:
+                self._inflight[key] = fut
+                fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # タイムアウトしても計算自体は続け、同じキーの後続リクエストが結果を使えるようにする
+        return await asyncio.wait_for(asyncio.shield(fut), COMPUTE_TIMEOUT)
+
+HISTORY_COLUMNS = "timestamp, price, month, day, hour, deviation, momentum"
+HISTORY_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+class PriceAnalytics:
+    """計算用プロセスに持たせた履歴の読み込み状態と件数を管理する"""
+    def __init__(self, executor):
+        self.executor = executor
+        self._load_lock = asyncio.Lock()
+        self._refit_task = None
+        self._generation = 0
+        self._changed_since = None
+        self.invalidate()
+
+    def invalidate(self, since=None):
+        # 履歴が変更された場合、次回利用時に DB と突き合わせて読み直す。
+        # since があれば、スナップショットのその時刻以降を捨ててから差分を読む
+        self.loaded = False
+        self.count = 0
+        self.trained_rows = 0
+        self._generation += 1
+        if since is not None:
+            self._changed_since = since if self._changed_since is None else min(self._changed_since, since)
+
+    async def _load_after(self, last_ts):
+        # last_ts より新しい行を HISTORY_LOAD_CHUNK 件ずつワーカーへ追記する。
+        # (読み込んだ件数, 特徴量が未保存だった最も古い時刻) を返す
+        loaded, missing_since = 0, None
+        while True:
+            async with get_db_connection() as conn:
+                rows = await conn.fetch(f"SELECT {HISTORY_COLUMNS} FROM history WHERE timestamp > $1 ORDER BY timestamp ASC LIMIT $2",
+                                        last_ts or HISTORY_EPOCH, HISTORY_LOAD_CHUNK)
+            if not rows: break
+            backfill = await self.executor.run(None, analytics.worker_append, [tuple(r) for r in rows])
+            if backfill and missing_since is None: missing_since = backfill[0][3]
+            loaded += len(rows)
+            last_ts = rows[-1]['timestamp']
+            if len(rows) < HISTORY_LOAD_CHUNK: break
+        return loaded, missing_since
+
+    @metrics.subsystem('prediction.load_history')
+    async def ensure_loaded(self):
+        async with self._load_lock:
+            if self.loaded: return
+            generation, changed_since = self._generation, self._changed_since
+            # DB 接続は問い合わせの間だけ借り、ワーカーでの計算 (起動・import を含む) 中は返しておく
+            async with get_db_connection() as conn:
+                db_count, db_max = await conn.fetchrow("SELECT COUNT(*), MAX(timestamp) FROM history")
+            # スナップショットを DB の最新時刻 (と変更のあった時刻の手前) に揃え、それより新しい行だけを読み込む
+            count, last_ts = await self.executor.run(None, analytics.worker_sync, db_max, changed_since)
+            loaded, missing_since = await self._load_after(last_ts)
+            if count + loaded != db_count:
+                # 停止中に途中の行が変更された場合など、変更箇所が分からないときは全件読み直す
+                count, _ = await self.executor.run(None, analytics.worker_sync, None)
+                loaded, missing_since = await self._load_after(None)
+            # 特徴量列を追加する前の行だけが対象。行ごとに UPDATE せず1文でまとめて埋める
+            if missing_since is not None:
+                async with get_db_connection() as conn:
+                    await conn.execute(BACKFILL_FEATURES_SQL, missing_since)
+            self.count, self.trained_rows = count + loaded, 0
+            # 読み込み中に通知が来ていれば、次回もう一度突き合わせる
+            if generation == self._generation:
+                self.loaded = True
+                self._changed_since = None
+            # 保存済みのモデルが無い・古い場合は、予測を待たせずにワーカー側で学習を始めておく
+            self.schedule_refit()
+
+    async def push(self, timestamp, price, month, day, hour):
+        await self.ensure_loaded()
+        features = await self.executor.run(None, analytics.worker_push, timestamp, price, month, day, hour)
+        self.count += 1
+        return features
+
+    async def refit(self, force=False):
+        self.trained_rows = await self.executor.run('refit', analytics.worker_refit, force)
+
+    def schedule_refit(self, force=False):
+        self._refit_task = asyncio.create_task(self.refit(force))
+        self._refit_task.add_done_callback(self._refit_done)
+
+    def _refit_done(self, task):
+        # 再学習は投げっぱなしなので、失敗はここで拾ってログに残す
+        if not task.cancelled() and task.exception() is not None:
+            print(f'Model refit error: {task.exception()!r}')
+
+    async def analyze(self):
+        await self.ensure_loaded()
+        now = datetime.now(timezone_jp)
+        return await self.executor.run(('analyze', now.month, now.day, now.hour), analytics.worker_analyze, now.month, now.day, now.hour)
+
+class Prediction(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.compute_executor = ComputeExecutor()
+        self.price_analytics = PriceAnalytics(self.compute_executor)
+        self.compute_executor.on_restart = self.price_analytics.invalidate
+
+    async def cog_load(self):
+        self.compute_executor.start()
+        self.refit_model_task.start()
+        # 一括取り込みや他インスタンスでの変更はプロセス共有の LISTEN 接続で受け取る
+        await self.bot.listener.add_listener(HISTORY_CHANNEL, self.on_history_changed)
+        self.bot.listener.add_reconnect_callback(self.on_listen_reconnect)
+
+    async def cog_unload(self):
+        self.refit_model_task.cancel()
+        self.compute_executor.shutdown()
+        self.bot.listener.remove_listener(HISTORY_CHANNEL, self.on_history_changed)
+        self.bot.listener.remove_reconnect_callback(self.on_listen_reconnect)
+
+    def on_history_changed(self, payload):
+        kind, instance, since = parse_history_payload(payload)
+        # 自インスタンスでの変更は送信前に反映済み
+        if instance == INSTANCE_ID: return
+        if kind == 'insert': adjust_history_count(1)
+        else: reset_history_count()
+        self.price_analytics.invalidate(since)
+
+    async def on_listen_reconnect(self):
+        # 切断中の通知は失われているので、次回利用時に DB と突き合わせ直す
+        self.price_analytics.invalidate()
+        reset_history_count()
+
+    @metrics.subsystem('prediction.analysis')
+    async def get_full_analysis(self):
+        try: return await self.price_analytics.analyze()
+        except Exception: return "AI調整中", 0, 50, 0.0
+
+    @metrics.subsystem('db.save_price')
+    async def save_price(self, price, pred_price=None):
+        now = datetime.now(timezone_jp)
+        ma5, deviation, momentum = await self.price_analytics.push(now, price, now.month, now.day, now.hour)
+        try:
+            async with get_db_connection() as conn:
+                await conn.execute("INSERT INTO history (timestamp, price, month, day, hour, prediction_price, ma5, deviation, momentum) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)",
+                                   now, price, now.month, now.day, now.hour, pred_price, ma5, deviation, momentum)
+                # 他のシャードのスナップショットと件数も古くなるので知らせる
+                await notify_history(conn, 'insert', now)
+        except Exception:
+            # 計算用プロセス側にだけ追加された状態になるので読み直させる
+            self.price_analytics.invalidate()
+            raise
+        adjust_history_count(1)
+        self.price_analytics.schedule_refit()
+
+    @tasks.loop(minutes=MODEL_REFIT_MINUTES)
+    async def refit_model_task(self):
+        if self.price_analytics.loaded and self.price_analytics.count > self.price_analytics.trained_rows:
+            self.price_analytics.schedule_refit(force=True)
+
+    @app_commands.command(name="prediction", description="カカポの株価を予測します")
+    @metrics.command("prediction")
+    async def prediction(self, interaction: discord.Interaction, price: int):
+        if interaction.user.id != YOUR_USER_ID: return await interaction.response.send_message("⚠️ 開発者専用", ephemeral=True)
+        await interaction.response.defer()
+        status, diff, rsi, score = await self.get_full_analysis()
+        predicted_next = float(price + diff)
+        await self.save_price(float(price), predicted_next)
+        embed = discord.Embed(title="🕊️ カカポ株価　AI診断", description=f"最新価格 **{price}** を分析しました。", color=0x5865F2)
+        embed.add_field(name="🤖 総合判定", value=f"**{status}**", inline=False)
+        embed.add_field(name="🎯 次回予測価格", value=f"{int(predicted_next)}", inline=True)
+        embed.add_field(name="🌡️ RSI (熱感)", value=f"{rsi}%", inline=True)
+        embed.add_field(name="📈 変動幅予想", value=f"{diff:+d}", inline=True)
+        embed.add_field(name="📊 AIスコア", value=f"{score:+.1f}", inline=True)
+        embed.add_field(name="📚 蓄積データ", value=f"{await get_history_count()} 件", inline=True)
+        embed.set_footer(text="AI学習式株価予測")
+        await interaction.followup.send(embed=embed)
+
+    @app_commands.command(name="show_data", description="データの保存履歴と的中判定を表示します")
+    @metrics.command("show_data")
+    async def show_data(self, interaction: discord.Interaction):
+        rows = await load_history_tail(10)
+        if not rows: return await interaction.response.send_message("📚 データなし")
+        lines = []
+        for i, row in enumerate(rows):
+            ts = row['timestamp'].astimezone(timezone_jp).strftime('%m/%d %H:%M')
+            hit_mark = ""
+            if i > 0 and i + 1 < len(rows):
+                prev = rows[i+1]
+                if prev['prediction_price'] is not None:
+                    hit_mark = " ✅" if int(round(float(row['price']))) == int(round(float(prev['prediction_price']))) else " ❌"
+            lines.append(f"📁 {ts} | 価格: **{int(row['price'])}**{hit_mark}{' (結果待ち)' if i == 0 else ''}")
+        await interaction.response.send_message(embed=discord.Embed(title="📚 最新10件の履歴と的中判定", description="\n".join(lines), color=0x2ecc71))
+
+    @app_commands.command(name="delete_latest", description="最新のデータを一件削除します")
+    @metrics.command("delete_latest")
+    async def delete_latest(self, interaction: discord.Interaction):
+        if interaction.user.id != YOUR_USER_ID: return
+        async with get_db_connection() as conn:
+            deleted = await conn.fetch("DELETE FROM history WHERE timestamp = (SELECT timestamp FROM history ORDER BY timestamp DESC LIMIT 1) RETURNING timestamp")
+            if deleted: await notify_history(conn, 'delete', deleted[0]['timestamp'])
+        cnt = len(deleted)
+        if cnt > 0:
+            adjust_history_count(-cnt)
+            self.price_analytics.invalidate(deleted[0]['timestamp'])
+        await interaction.response.send_message("✅ 削除成功" if cnt > 0 else "⚠️ データなし")
+
+async def setup(bot):
+    await bot.add_cog(Prediction(bot))
@@ -0,0 +1,376 @@
+import os
+import asyncio
+import heapq
+from datetime import datetime, timedelta
+import discord
+from discord import app_commands
+from discord.ext import commands, tasks
+from config import timezone_jp
+from db import get_db_connection
+import metrics
+
+# ==========================================
+# リマインダー
+# ==========================================
+REMINDER_CHANNEL = 'reminders_changed'
+# スケジューラの取りこぼし対策として、低頻度で期限切れを掃除する間隔 (秒)
+REMINDER_SWEEP_SECONDS = float(os.getenv('REMINDER_SWEEP_SECONDS', '300'))
+REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', '500'))
+# DM 送信の同時実行数。レート制限の待機自体は discord.py の HTTP クライアントがバケット単位で行う
+REMINDER_SEND_CONCURRENCY = int(os.getenv('REMINDER_SEND_CONCURRENCY', '5'))
+# 1ユーザーあたりの上限件数
+REMINDER_LIMIT = 3
+
+# 期限切れの行を1文で確保し、同時に「一度限りは削除 / 繰り返しは次回時刻へ更新」まで済ませる。
+# SKIP LOCKED により、他インスタンスやスイープと同時に走っても同じ行を二重に取らない
+CLAIM_DUE_REMINDERS_SQL = '''
+WITH due AS (
+    SELECT id, user_id, time, interval_weeks FROM reminders
+    WHERE time <= $1 ORDER BY time LIMIT $2
+    FOR UPDATE SKIP LOCKED
+), removed AS (
+    DELETE FROM reminders r USING due
+    WHERE r.id = due.id AND due.interval_weeks <= 0
+), advanced AS (
+    UPDATE reminders r SET time = due.time + make_interval(hours => due.interval_weeks)
+    FROM due WHERE r.id = due.id AND due.interval_weeks > 0
+    RETURNING r.id, r.time
+)
+SELECT due.id, due.user_id, due.time, due.interval_weeks, advanced.time AS next_time
+FROM due LEFT JOIN advanced ON advanced.id = due.id
+'''
+
+# 上限の確認と追加を1文で行う (上限に達していれば行が返らない)。
+# READ COMMITTED では同時に実行された2文がどちらも追加前の件数を見てしまうため、
+# 同じユーザーの追加は REMINDER_LOCK_CLASS の advisory lock で直列化してから実行する
+REMINDER_LOCK_CLASS = 0x52454d
+INSERT_REMINDER_SQL = '''
+INSERT INTO reminders (user_id, time, interval_weeks)
+SELECT $1, $2, $3
+WHERE (SELECT COUNT(*) FROM reminders WHERE user_id = $1) < $4
+RETURNING id
+'''
+
+class ReminderScheduler:
+    """reminders.time をキーにした最小ヒープで、次の期限まで眠って待つスケジューラ。
+
+    削除や時刻変更は遅延評価: ヒープから取り出した時点で _entries と一致しない要素は捨てる。
+    """
+    def __init__(self, dispatch):
+        self._dispatch = dispatch
+        self._heap = []       # (time, id)
+        self._entries = {}    # id -> (time, user_id)
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def start(self):
+        if self._task is not None: return
+        # 先に起動して push を受け付けるようにしてから読み込む (読み込み中の追加を取りこぼさない)
+        self._task = asyncio.create_task(self._run())
+        await self.reload()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._heap, self._entries = [], {}
+
+    async def reload(self):
+        # 起動時と LISTEN の再接続時 (切断中の通知は届かない) に DB から読み直す
+        if self._task is None: return
+        async with get_db_connection() as conn:
+            rows = await conn.fetch("SELECT id, user_id, time FROM reminders")
+        entries = {r_id: (r_time, u_id) for r_id, u_id, r_time in rows}
+        # 読み込み中に通知で入った分は残す。時刻は進む方向にしか変わらないので遅い方を採る
+        for r_id, (r_time, u_id) in self._entries.items():
+            if r_id not in entries or entries[r_id][0] < r_time:
+                entries[r_id] = (r_time, u_id)
+        self._entries = entries
+        self._heap = [(t, r_id) for r_id, (t, _) in entries.items()]
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+
+    def push(self, r_id, user_id, when):
+        # リーダーでない (起動していない) インスタンスでは保持しない
+        if self._task is None: return
+        if self._entries.get(r_id) == (when, user_id): return
+        self._entries[r_id] = (when, user_id)
+        heapq.heappush(self._heap, (when, r_id))
+        if self._heap[0] == (when, r_id): self._wakeup.set()
+
+    def discard_user(self, user_id):
+        for r_id in [r_id for r_id, (_, u_id) in self._entries.items() if u_id == user_id]:
+            del self._entries[r_id]
+        self._wakeup.set()
+
+    def on_notify(self, payload):
+        # payload: "add:<id>:<user_id>:<iso time>" または "stop:<user_id>"
+        kind, _, rest = payload.partition(':')
+        if kind == 'add':
+            r_id, u_id, when = rest.split(':', 2)
+            self.push(int(r_id), int(u_id), datetime.fromisoformat(when))
+        elif kind == 'stop':
+            self.discard_user(int(rest))
+
+    def _pop_due(self, now):
+        due = False
+        while self._heap and self._heap[0][0] <= now:
+            when, r_id = heapq.heappop(self._heap)
+            entry = self._entries.get(r_id)
+            if entry is not None and entry[0] == when:
+                del self._entries[r_id]
+                due = True
+        return due
+
+    def _next_delay(self):
+        while self._heap:
+            when, r_id = self._heap[0]
+            entry = self._entries.get(r_id)
+            if entry is not None and entry[0] == when:
+                return (when - datetime.now(timezone_jp)).total_seconds()
+            heapq.heappop(self._heap)
+        return None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if self._pop_due(datetime.now(timezone_jp)):
+                try: await self._dispatch()
+                except Exception as e: print(f'Reminder dispatch error: {e}')
+                continue
+            delay = self._next_delay()
+            try: await asyncio.wait_for(self._wakeup.wait(), timeout=max(delay, 0) if delay is not None else None)
+            except asyncio.TimeoutError: pass
+
+async def notify_reminders(conn, *payloads):
+    if not payloads: return
+    await conn.execute("SELECT pg_notify($1, p) FROM unnest($2::text[]) AS p", REMINDER_CHANNEL, list(payloads))
+
+def reminder_payload(r_id, user_id, when):
+    return f"add:{r_id}:{user_id}:{when.isoformat()}"
+
+class UserReminderCache:
+    """ユーザーごとの設定中リマインダー (id, time, interval_weeks) を時刻順に保持する。
+
+    自インスタンスでの変更はその場で反映し、他インスタンスでの変更は NOTIFY を受けて読み直させる。
+    """
+    def __init__(self):
+        self._users = {}   # user_id -> [(id, time, interval_weeks)]
+        # 読み込み中に破棄された場合、古い結果で上書きしないための世代番号
+        self._generation = 0
+
+    def clear(self):
+        # LISTEN の再接続時など、取りこぼした変更がありうるときは全員分を捨てる
+        self._users = {}
+        self._generation += 1
+
+    @metrics.subsystem('db.user_reminders')
+    async def get(self, user_id):
+        rows = self._users.get(user_id)
+        if rows is None:
+            generation = self._generation
+            async with get_db_connection() as conn:
+                rows = [tuple(r) for r in await conn.fetch("SELECT id, time, interval_weeks FROM reminders WHERE user_id = $1 ORDER BY time ASC", user_id)]
+            if generation == self._generation: self._users[user_id] = rows
+        return rows
+
+    def put(self, user_id, r_id, when, interval_weeks):
+        # 読み込み済みのユーザーだけ更新する (未読込なら次回 get で DB から読む)
+        rows = self._users.get(user_id)
+        if rows is None: return
+        self._users[user_id] = sorted([r for r in rows if r[0] != r_id] + [(r_id, when, interval_weeks)], key=lambda r: r[1])
+
+    def remove(self, user_id, r_id):
+        rows = self._users.get(user_id)
+        if rows is None: return
+        self._users[user_id] = [r for r in rows if r[0] != r_id]
+
+    def discard_user(self, user_id):
+        self._users[user_id] = []
+
+    def invalidate(self, user_id):
+        self._users.pop(user_id, None)
+        self._generation += 1
+
+    def on_notify(self, payload):
+        # payload: "add:<id>:<user_id>:<iso time>" / "done:<id>:<user_id>" / "stop:<user_id>"
+        kind, _, rest = payload.partition(':')
+        if kind == 'add':
+            r_id, u_id, when = rest.split(':', 2)
+            rows = self._users.get(int(u_id))
+            # 自インスタンスで反映済みの変更は読み直さない
+            if rows is not None and (int(r_id), datetime.fromisoformat(when)) in [r[:2] for r in rows]: return
+            self.invalidate(int(u_id))
+        elif kind == 'done':
+            r_id, u_id = rest.split(':')
+            self.remove(int(u_id), int(r_id))
+        elif kind == 'stop':
+            self.discard_user(int(rest))
+
+class Reminders(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.scheduler = ReminderScheduler(self.dispatch_due_reminders)
+        self.user_cache = UserReminderCache()
+        self.send_semaphore = asyncio.Semaphore(REMINDER_SEND_CONCURRENCY)
+        self._active = False
+        self._dispatching = set()
+
+    async def cog_load(self):
+        # 複数インスタンス間の同期はプロセス共有の LISTEN 接続で受け取る
+        await self.bot.listener.add_listener(REMINDER_CHANNEL, self.user_cache.on_notify)
+        await self.bot.listener.add_listener(REMINDER_CHANNEL, self.scheduler.on_notify)
+        self.bot.listener.add_reconnect_callback(self.on_listen_reconnect)
+        # 配信はリーダーに選ばれたインスタンスだけが行う (他はコマンドの受付のみ)
+        self.bot.leader.add_listener(self.on_leader_change)
+
+    async def cog_unload(self):
+        self.bot.leader.remove_listener(self.on_leader_change)
+        await self.on_leader_change(False)
+        self.bot.listener.remove_listener(REMINDER_CHANNEL, self.user_cache.on_notify)
+        self.bot.listener.remove_listener(REMINDER_CHANNEL, self.scheduler.on_notify)
+        self.bot.listener.remove_reconnect_callback(self.on_listen_reconnect)
+        self.user_cache.clear()
+
+    async def on_listen_reconnect(self):
+        # 切断中の通知は失われているので、キャッシュを捨ててヒープを読み直す
+        self.user_cache.clear()
+        await self.scheduler.reload()
+
+    async def on_leader_change(self, is_leader):
+        self._active = is_leader
+        if is_leader:
+            if not self.check_reminders_task.is_running(): self.check_reminders_task.start()
+            await self.scheduler.start()
+        else:
+            self.check_reminders_task.cancel()
+            await self.scheduler.stop()
+            # 確保済みのバッチは送り切ってから降りる (DB 側ではもう削除・更新されている)
+            for result in await asyncio.gather(*self._dispatching, return_exceptions=True):
+                if isinstance(result, Exception): print(f'Reminder dispatch error: {result}')
+
+    async def add_reminder(self, user_id, when, interval_weeks):
+        # 上限に達していれば None を返す
+        async with get_db_connection() as conn:
+            async with conn.transaction():
+                # 2引数版のキーはリーダー選出の1引数版のキーとは重ならない
+                await conn.execute("SELECT pg_advisory_xact_lock($1, hashtext($2::bigint::text))", REMINDER_LOCK_CLASS, user_id)
+                r_id = await conn.fetchval(INSERT_REMINDER_SQL, user_id, when, interval_weeks, REMINDER_LIMIT)
+                if r_id is not None:
+                    # NOTIFY はコミット時に届く
+                    await notify_reminders(conn, reminder_payload(r_id, user_id, when))
+        if r_id is None:
+            self.user_cache.invalidate(user_id)
+            return None
+        self.user_cache.put(user_id, r_id, when, interval_weeks)
+        self.scheduler.push(r_id, user_id, when)
+        return r_id
+
+    async def send_reminder(self, user_id, r_time):
+        async with self.send_semaphore:
+            try:
+                # キャッシュにいないユーザーは API から取得する
+                user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+                embed = discord.Embed(title="⏰ 通知", description="お約束の時間です。ご確認をお願いします。", color=0xff0000)
+                embed.set_footer(text=f"設定: {r_time.astimezone(timezone_jp).strftime('%H:%M:%S')}")
+                await user.send(content=f"{user.mention}", embed=embed)
+            except discord.HTTPException: pass
+
+    async def dispatch_due_reminders(self):
+        # 確保がコミットされた後に取り消されると、その分は誰にも送られずに失われる。
+        # 本体は別タスクで走らせ、呼び出し元 (スケジューラ・スイープ) が止められても最後まで送らせる
+        task = asyncio.ensure_future(self._dispatch_due_reminders())
+        self._dispatching.add(task)
+        task.add_done_callback(self._dispatching.discard)
+        await asyncio.shield(task)
+
+    @metrics.subsystem('reminders.dispatch')
+    async def _dispatch_due_reminders(self):
+        while True:
+            async with get_db_connection() as conn:
+                due = await conn.fetch(CLAIM_DUE_REMINDERS_SQL, datetime.now(timezone_jp), REMINDER_BATCH_SIZE)
+                payloads = []
+                for r in due:
+                    if r['next_time'] is None:
+                        self.user_cache.remove(r['user_id'], r['id'])
+                        payloads.append(f"done:{r['id']}:{r['user_id']}")
+                    else:
+                        self.user_cache.put(r['user_id'], r['id'], r['next_time'], r['interval_weeks'])
+                        self.scheduler.push(r['id'], r['user_id'], r['next_time'])
+                        payloads.append(reminder_payload(r['id'], r['user_id'], r['next_time']))
+                await notify_reminders(conn, *payloads)
+            # DB 接続を返してから送信する
+            await asyncio.gather(*(self.send_reminder(r['user_id'], r['time']) for r in due))
+            # リーダーでなくなったら次のバッチは確保しない
+            if len(due) < REMINDER_BATCH_SIZE or not self._active: break
+
+    # 通常の配信はスケジューラが担当し、こちらは取りこぼし用の低頻度スイープのみ
+    @tasks.loop(seconds=REMINDER_SWEEP_SECONDS)
+    async def check_reminders_task(self):
+        await self.dispatch_due_reminders()
+
+    @app_commands.command(name="remind", description="指定日時に通知を設定します")
+    @app_commands.describe(date="YYYY/MM/DD", time="HH:MM:SS")
+    @metrics.command("remind")
+    async def remind(self, interaction: discord.Interaction, date: str, time: str):
+        user_reminders = await self.user_cache.get(interaction.user.id)
+        if len(user_reminders) >= REMINDER_LIMIT: return await interaction.response.send_message("⚠️ 最大3件までです。", ephemeral=True)
+        try:
+            dt = timezone_jp.localize(datetime.strptime(f"{date} {time}", "%Y/%m/%d %H:%M:%S"))
+            if dt < datetime.now(timezone_jp): return await interaction.response.send_message("⚠️ 過去の時間は設定できません。", ephemeral=True)
+            if await self.add_reminder(interaction.user.id, dt, 0) is None: return await interaction.response.send_message("⚠️ 最大3件までです。", ephemeral=True)
+            await interaction.response.send_message(f"✅ 設定完了: {date} {time}")
+        except: await interaction.response.send_message("⚠️ 形式エラー (2026/01/01 12:00:00)", ephemeral=True)
+
+    @app_commands.command(name="remind_repeat", description="一定間隔で通知を設定します")
+    @app_commands.describe(interval="間隔（数字）", unit="単位", time="基準時刻 HH:MM:SS")
+    @app_commands.choices(unit=[
+        app_commands.Choice(name="週間おき", value="weeks"),
+        app_commands.Choice(name="時間おき", value="hours")
+    ])
+    @metrics.command("remind_repeat")
+    async def remind_repeat(self, interaction: discord.Interaction, interval: int, unit: app_commands.Choice[str], time: str):
+        user_reminders = await self.user_cache.get(interaction.user.id)
+        if len(user_reminders) >= REMINDER_LIMIT:
+            return await interaction.response.send_message("⚠️ 最大3件までです。", ephemeral=True)
+
+        try:
+            now = datetime.now(timezone_jp)
+            t = datetime.strptime(time, "%H:%M:%S").time()
+            target_dt = timezone_jp.localize(datetime.combine(now.date(), t))
+
+            interval_in_hours = interval if unit.value == "hours" else interval * 168
+
+            if target_dt < now:
+                target_dt += timedelta(hours=interval_in_hours)
+
+            if await self.add_reminder(interaction.user.id, target_dt, interval_in_hours) is None:
+                return await interaction.response.send_message("⚠️ 最大3件までです。", ephemeral=True)
+
+            await interaction.response.send_message(f"✅ 繰り返し設定完了: {interval}{unit.name} (初回: {target_dt.strftime('%m/%d %H:%M')})")
+        except:
+            await interaction.response.send_message("⚠️ 形式エラー (例: 09:00:00)", ephemeral=True)
+
+    @app_commands.command(name="remindlist", description="現在設定中の通知を確認します")
+    @metrics.command("remindlist")
+    async def remindlist(self, interaction: discord.Interaction):
+        data = await self.user_cache.get(interaction.user.id)
+        if not data: return await interaction.response.send_message("🔔 設定中の通知はありません。", ephemeral=True)
+        embed = discord.Embed(title="🔔 通知リスト", color=0x3498db)
+        for i, r in enumerate(data):
+            cycle = f" ({r[2]}週間おき)" if r[2] > 0 else " (一度限り)"
+            embed.add_field(name=f"No.{i+1}", value=f"時間: {r[1].astimezone(timezone_jp).strftime('%Y/%m/%d %H:%M')}{cycle}", inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="remindstop", description="すべての通知をオフにします")
+    @metrics.command("remindstop")
+    async def remindstop(self, interaction: discord.Interaction):
+        async with get_db_connection() as conn:
+            await conn.execute("DELETE FROM reminders WHERE user_id = $1", interaction.user.id)
+            self.scheduler.discard_user(interaction.user.id)
+            self.user_cache.discard_user(interaction.user.id)
+            await notify_reminders(conn, f"stop:{interaction.user.id}")
+        await interaction.response.send_message("✅ すべて削除しました。")
+
+async def setup(bot):
+    await bot.add_cog(Reminders(bot))
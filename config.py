@@ -0,0 +1,28 @@
+import os
+from datetime import datetime
+import pytz
+
+# --- Secrets ---
+DATABASE_URL = os.getenv('DATABASE_URL')
+DISCORD_BOT_TOKEN = os.getenv('DISCORD_BOT_TOKEN')
+ANNICT_TOKEN = os.getenv('ANNICT_TOKEN')
+YOUR_USER_ID = 1421704357983813744 
+
+# --- 基本設定 ---
+timezone_jp = pytz.timezone('Asia/Tokyo')
+start_time = datetime.now(timezone_jp)
+
+# --- シャーディング ---
+# SHARD_COUNT を指定すると AutoShardedBot として動く。SHARD_IDS="0,1" で担当するシャードを限定できる
+# (launcher.py がプロセスごとに設定する)
+SHARD_COUNT = int(os.getenv('SHARD_COUNT')) if os.getenv('SHARD_COUNT') else None
+SHARD_IDS = [int(i) for i in os.getenv('SHARD_IDS', '').split(',') if i.strip()] or None
+
+# --- 機能の切り替え ---
+# 各機能は cogs/ 以下の拡張として読み込む。DISABLED_FEATURES="music,prediction" のように指定すると、
+# その機能のコマンドも重い依存ライブラリも読み込まれない
+FEATURES = ('reminders', 'prediction', 'music', 'anime')
+DISABLED_FEATURES = {f.strip() for f in os.getenv('DISABLED_FEATURES', '').split(',') if f.strip()}
+
+def enabled_features():
+    return [f for f in FEATURES if f not in DISABLED_FEATURES]
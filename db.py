@@ -0,0 +1,104 @@
+import os
+import uuid
+from datetime import datetime
+import asyncpg
+from config import DATABASE_URL
+import metrics
+
+# ==========================================
+# データベース操作
+# ==========================================
+# 接続プール設定 (環境変数で調整可能)
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '5'))
+DB_ACQUIRE_TIMEOUT = float(os.getenv('DB_ACQUIRE_TIMEOUT', '10'))
+DB_COMMAND_TIMEOUT = float(os.getenv('DB_COMMAND_TIMEOUT', '30'))
+
+db_pool = None
+
+async def init_db_pool():
+    global db_pool
+    # asyncpg は接続ごとにプリペアドステートメントをキャッシュするため、
+    # 同じ SQL の2回目以降はパース・プランニングが省略される
+    db_pool = await asyncpg.create_pool(
+        DATABASE_URL,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        command_timeout=DB_COMMAND_TIMEOUT,
+    )
+
+async def close_db_pool():
+    global db_pool
+    if db_pool is not None:
+        await db_pool.close()
+        db_pool = None
+
+def get_db_connection():
+    # async with get_db_connection() as conn: の形で使う (取得待ちはタイムアウト付き)
+    return db_pool.acquire(timeout=DB_ACQUIRE_TIMEOUT)
+
+async def init_db():
+    async with get_db_connection() as conn:
+        await conn.execute('''CREATE TABLE IF NOT EXISTS history 
+                       (timestamp TIMESTAMPTZ, price FLOAT, month INT, day INT, hour INT, prediction_price FLOAT)''')
+        # 特徴量は保存時に計算して履歴と一緒に持つ
+        await conn.execute("ALTER TABLE history ADD COLUMN IF NOT EXISTS ma5 FLOAT, ADD COLUMN IF NOT EXISTS deviation FLOAT, ADD COLUMN IF NOT EXISTS momentum FLOAT")
+        await conn.execute("CREATE INDEX IF NOT EXISTS history_timestamp_idx ON history (timestamp)")
+        await conn.execute('''CREATE TABLE IF NOT EXISTS reminders 
+                       (id SERIAL PRIMARY KEY, user_id BIGINT, time TIMESTAMPTZ, interval_weeks INT)''')
+        await conn.execute("CREATE INDEX IF NOT EXISTS reminders_time_idx ON reminders (time)")
+        await conn.execute("CREATE INDEX IF NOT EXISTS reminders_user_idx ON reminders (user_id)")
+
+# 履歴の追加・削除・一括取り込みを他インスタンスへ知らせる NOTIFY チャンネル。
+# payload: "<insert|delete|ingest>:<送信元 ID>:<変更があった最も古い時刻 (ISO) または空>"
+HISTORY_CHANNEL = 'history_changed'
+# 自インスタンスが送った通知を見分けるための ID
+INSTANCE_ID = uuid.uuid4().hex
+
+async def notify_history(conn, kind, since=None):
+    await conn.execute("SELECT pg_notify($1, $2)", HISTORY_CHANNEL, f"{kind}:{INSTANCE_ID}:{since.isoformat() if since else ''}")
+
+def parse_history_payload(payload):
+    kind, instance, since = payload.split(':', 2)
+    return kind, instance, datetime.fromisoformat(since) if since else None
+
+# since 以降の行の特徴量 (ma5 / deviation / momentum) を窓関数でまとめて計算し直す。
+# 計算には直前4件が必要なので、その位置から窓を走らせる (price_model.PriceModel.append と同じ式)
+BACKFILL_FEATURES_SQL = '''
+UPDATE history h SET ma5 = f.ma5, deviation = (h.price - f.ma5) / f.ma5 * 100, momentum = f.momentum
+FROM (
+    SELECT timestamp,
+           AVG(price) OVER (ORDER BY timestamp ROWS BETWEEN 4 PRECEDING AND CURRENT ROW) AS ma5,
+           COALESCE(price - LAG(price, 3) OVER (ORDER BY timestamp), 0) AS momentum
+    FROM history
+    WHERE timestamp >= COALESCE((SELECT timestamp FROM history WHERE timestamp < $1 ORDER BY timestamp DESC OFFSET 3 LIMIT 1), '-infinity')
+) f
+WHERE h.timestamp = f.timestamp AND h.timestamp >= $1
+'''
+
+# 件数はキャッシュし、追加・削除のたびに更新する (全件読み込みを避ける)
+history_row_count = None
+
+@metrics.subsystem('db.history_count')
+async def get_history_count():
+    global history_row_count
+    if history_row_count is None:
+        async with get_db_connection() as conn:
+            history_row_count = await conn.fetchval("SELECT COUNT(*) FROM history")
+    return history_row_count
+
+def reset_history_count():
+    # 外部から一括取り込みされた場合など、次回参照時に数え直す
+    global history_row_count
+    history_row_count = None
+
+def adjust_history_count(delta):
+    global history_row_count
+    if history_row_count is not None:
+        history_row_count += delta
+
+@metrics.subsystem('db.history_tail')
+async def load_history_tail(n):
+    # 新しい順に最新 n 件 (timestamp の索引を使う)
+    async with get_db_connection() as conn:
+        return await conn.fetch("SELECT timestamp, price, prediction_price FROM history ORDER BY timestamp DESC LIMIT $1", n)
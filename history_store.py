@@ -0,0 +1,69 @@
+import os
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+# ==========================================
+# history テーブルの列指向スナップショット (計算用プロセス内でのみ import される)
+# ==========================================
+# 列ごとに1つの生バイナリファイルへ追記し、読み込みは memmap で行う (コピーしない)。
+# DB との差分だけを追記するので、再起動後も全件を読み直さずに済む
+COLUMNS = {
+    'timestamp': np.int64,   # UNIX 時刻 (マイクロ秒)
+    'price': np.float64,
+    'month': np.float64,
+    'day': np.float64,
+    'hour': np.float64,
+    'deviation': np.float64,
+    'momentum': np.float64,
+}
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def to_micros(dt):
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+def from_micros(us):
+    return EPOCH + timedelta(microseconds=int(us))
+
+class HistoryStore:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        for name in COLUMNS:
+            open(self._file(name), 'ab').close()
+        # 書き込み途中で落ちた場合に備え、一番短い列に揃える
+        self.count = min(os.path.getsize(self._file(name)) // np.dtype(dtype).itemsize for name, dtype in COLUMNS.items())
+        self.truncate(self.count)
+
+    def _file(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def column(self, name):
+        if name not in self._maps:
+            self._maps[name] = np.memmap(self._file(name), dtype=COLUMNS[name], mode='r', shape=(self.count,)) if self.count else np.empty(0, dtype=COLUMNS[name])
+        return self._maps[name]
+
+    def append(self, columns):
+        n = len(columns['price'])
+        if n == 0: return
+        for name, dtype in COLUMNS.items():
+            with open(self._file(name), 'ab') as f:
+                f.write(np.asarray(columns[name], dtype=dtype).tobytes())
+        self.count += n
+        self._maps = {}
+
+    def truncate(self, n):
+        for name, dtype in COLUMNS.items():
+            os.truncate(self._file(name), n * np.dtype(dtype).itemsize)
+        self.count = n
+        self._maps = {}
+
+    def last_timestamp(self):
+        return from_micros(self.column('timestamp')[-1]) if self.count else None
+
+    def count_until(self, dt):
+        # timestamp <= dt の行数 (timestamp 昇順に並んでいる前提)
+        return int(np.searchsorted(self.column('timestamp'), to_micros(dt), side='right'))
+
+    def count_before(self, dt):
+        # timestamp < dt の行数
+        return int(np.searchsorted(self.column('timestamp'), to_micros(dt), side='left'))
@@ -0,0 +1,84 @@
+import os
+import sys
+import csv
+import asyncio
+import argparse
+from datetime import datetime
+from config import timezone_jp
+from db import BACKFILL_FEATURES_SQL, init_db_pool, close_db_pool, init_db, get_db_connection, notify_history
+
+# ==========================================
+# 価格履歴の一括取り込み (CSV / Parquet)
+# ==========================================
+# python ingest.py prices.csv のように使う。列は timestamp, price (, prediction_price)。
+# 1行ずつ INSERT せず COPY で流し込み、特徴量も DB 側の窓関数でまとめて計算する
+# (ボット側は変更された範囲だけを差分で読み込めばよい)。
+INGEST_CHUNK_ROWS = int(os.getenv('INGEST_CHUNK_ROWS', '50000'))
+# 大量の行を扱うので、プールの既定 (DB_COMMAND_TIMEOUT) より長く待つ
+INGEST_COMMAND_TIMEOUT = float(os.getenv('INGEST_COMMAND_TIMEOUT', '600'))
+COPY_COLUMNS = ['timestamp', 'price', 'month', 'day', 'hour', 'prediction_price']
+
+def parse_timestamp(value):
+    dt = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).strip())
+    # タイムゾーン無しの時刻は日本時間とみなす
+    return timezone_jp.localize(dt) if dt.tzinfo is None else dt
+
+def read_rows(path):
+    if path.endswith('.parquet'):
+        # pyarrow は取り込み時にだけ必要になる任意の依存
+        try: import pyarrow.parquet as pq
+        except ImportError: sys.exit("❌ Parquet の読み込みには pyarrow が必要です (pip install pyarrow)")
+        yield from pq.read_table(path).to_pylist()
+    else:
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+
+def to_record(row):
+    dt = parse_timestamp(row['timestamp'])
+    local = dt.astimezone(timezone_jp)
+    pred = row.get('prediction_price')
+    return (dt, float(row['price']), local.month, local.day, local.hour, float(pred) if pred not in (None, '') else None)
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk: yield chunk
+
+async def ingest_records(conn, records):
+    # records: COPY_COLUMNS 順のタプル。(件数, 最も古い時刻) を返す
+    total, earliest = 0, None
+    async with conn.transaction():
+        for chunk in chunked(records, INGEST_CHUNK_ROWS):
+            await conn.copy_records_to_table('history', records=chunk, columns=COPY_COLUMNS, timeout=INGEST_COMMAND_TIMEOUT)
+            total += len(chunk)
+            first = min(r[0] for r in chunk)
+            earliest = first if earliest is None else min(earliest, first)
+            print(f"📥 {total} 件")
+        if earliest is not None:
+            # 取り込んだ時刻以降は直前の価格が変わるので、その範囲の特徴量を計算し直す
+            await conn.execute(BACKFILL_FEATURES_SQL, earliest, timeout=INGEST_COMMAND_TIMEOUT)
+            # 稼働中のボットはこの時刻以降だけを読み直す (NOTIFY はコミット時に届く)
+            await notify_history(conn, 'ingest', earliest)
+    return total, earliest
+
+async def ingest(path):
+    await init_db_pool()
+    try:
+        await init_db()
+        async with get_db_connection() as conn:
+            total, _ = await ingest_records(conn, (to_record(r) for r in read_rows(path)))
+        print(f"✅ 取り込み完了: {total} 件")
+    finally:
+        await close_db_pool()
+
+def main():
+    parser = argparse.ArgumentParser(description="価格履歴を history テーブルへ一括で取り込みます")
+    parser.add_argument('path', help="CSV または Parquet ファイル")
+    asyncio.run(ingest(parser.parse_args().path))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import os
+import sys
+import signal
+import subprocess
+import time
+
+# ==========================================
+# シャードごとにプロセスを分けて起動するランチャー
+# ==========================================
+# SHARD_COUNT が無ければ従来どおり bot.py を1プロセスで動かす。
+# 指定されていれば、シャード1つにつき1プロセスを起動し、落ちたものは再起動する。
+# リマインダー配信などはプロセス間でリーダー選出されるので、重複して送られることはない。
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py')
+RESTART_DELAY = float(os.getenv('SHARD_RESTART_DELAY', '5'))
+
+def shard_env(shard_id, shard_count):
+    env = dict(os.environ, SHARD_COUNT=str(shard_count), SHARD_IDS=str(shard_id))
+    # /metrics のポートはプロセスごとにずらす
+    if env.get('METRICS_PORT'):
+        env['METRICS_PORT'] = str(int(env['METRICS_PORT']) + shard_id)
+    return env
+
+def main():
+    shard_count = int(os.getenv('SHARD_COUNT', '0'))
+    if shard_count <= 0:
+        os.execv(sys.executable, [sys.executable, BOT_SCRIPT])
+
+    procs = {}
+    stopping = False
+
+    def start(shard_id):
+        # 停止要求の後に起動したプロセスは誰も止められなくなるので、起動直前に確認する
+        if stopping: return
+        procs[shard_id] = subprocess.Popen([sys.executable, BOT_SCRIPT], env=shard_env(shard_id, shard_count))
+        print(f"🚀 Shard {shard_id}/{shard_count}: pid {procs[shard_id].pid}")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for proc in list(procs.values()):
+            proc.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for shard_id in range(shard_count):
+        if stopping: break
+        start(shard_id)
+        # 同時に IDENTIFY しないよう少しずらす
+        time.sleep(RESTART_DELAY)
+
+    while not stopping:
+        for shard_id, proc in list(procs.items()):
+            if proc.poll() is not None and not stopping:
+                print(f"⚠️ Shard {shard_id} exited ({proc.returncode}), restarting")
+                time.sleep(RESTART_DELAY)
+                start(shard_id)
+        time.sleep(1)
+
+    # 停止要求の前後に起動したものも含め、いま残っているプロセスをすべて止めて待つ
+    for proc in procs.values():
+        if proc.poll() is None:
+            proc.terminate()
+    for proc in procs.values():
+        proc.wait()
+
+if __name__ == '__main__':
+    main()
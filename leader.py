@@ -0,0 +1,72 @@
+import os
+import asyncio
+import asyncpg
+from config import DATABASE_URL
+
+# ==========================================
+# リーダー選出 (Postgres advisory lock)
+# ==========================================
+# 複数プロセスで動かしたとき、リマインダー配信などの定期処理は1インスタンスだけが担当する
+LEADER_LOCK_KEY = int(os.getenv('LEADER_LOCK_KEY', '4346931915'))
+# ロック取得の再試行・接続確認の間隔 (秒)
+LEADER_RETRY_SECONDS = float(os.getenv('LEADER_RETRY_SECONDS', '10'))
+
+class LeaderElection:
+    """専用接続で pg_try_advisory_lock を取れたインスタンスをリーダーとする。
+
+    ロックはセッション単位なので、プロセスが落ちたり接続が切れたりすると自動で解放され、
+    他のインスタンスが次の再試行で引き継ぐ。
+    """
+    def __init__(self):
+        self.is_leader = False
+        self._conn = None
+        self._task = None
+        self._listeners = []
+
+    def add_listener(self, callback):
+        # callback(is_leader) はリーダーになったとき / 外れたときに await される
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners: self._listeners.remove(callback)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self._set_leader(False)
+        await self._close_conn()
+
+    async def _close_conn(self):
+        if self._conn is not None:
+            try: await self._conn.close(timeout=LEADER_RETRY_SECONDS)
+            except Exception: pass
+            self._conn = None
+
+    async def _set_leader(self, is_leader):
+        if self.is_leader == is_leader: return
+        self.is_leader = is_leader
+        print(f"👑 Leader: {is_leader}")
+        for callback in self._listeners:
+            try: await callback(is_leader)
+            except Exception as e: print(f'Leader callback error: {e}')
+
+    async def _run(self):
+        while True:
+            try:
+                if self._conn is None or self._conn.is_closed():
+                    await self._set_leader(False)
+                    self._conn = await asyncpg.connect(DATABASE_URL)
+                if self.is_leader:
+                    # ロックを持っている接続が生きているかを確認する (応答が返らなければ切れたものとして降りる)
+                    await self._conn.fetchval("SELECT 1", timeout=LEADER_RETRY_SECONDS)
+                else:
+                    await self._set_leader(await self._conn.fetchval("SELECT pg_try_advisory_lock($1)", LEADER_LOCK_KEY, timeout=LEADER_RETRY_SECONDS))
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                print(f'Leader election error: {e}')
+                await self._set_leader(False)
+                await self._close_conn()
+            await asyncio.sleep(LEADER_RETRY_SECONDS)
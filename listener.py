@@ -0,0 +1,100 @@
+import os
+import asyncio
+import asyncpg
+from config import DATABASE_URL
+
+# ==========================================
+# LISTEN/NOTIFY 用の共有接続 (切断時は再接続する)
+# ==========================================
+# 接続が生きているかを確認する間隔・再接続を試みる間隔 (秒)
+LISTEN_CHECK_SECONDS = float(os.getenv('LISTEN_CHECK_SECONDS', '30'))
+LISTEN_RETRY_SECONDS = float(os.getenv('LISTEN_RETRY_SECONDS', '5'))
+
+class NotifyListener:
+    """プロセス内の LISTEN をすべて1本の専用接続にまとめる。
+
+    切断されている間の通知は届かないので、再接続したときは add_reconnect_callback で
+    登録されたコールバックを await し、各機能にキャッシュの破棄や読み直しをさせる。
+    """
+    def __init__(self):
+        self._channels = {}   # channel -> [callback(payload)]
+        self._reconnect_callbacks = []
+        self._conn = None
+        self._task = None
+        self._lost = asyncio.Event()
+
+    async def add_listener(self, channel, callback):
+        callbacks = self._channels.setdefault(channel, [])
+        callbacks.append(callback)
+        if len(callbacks) == 1 and self._conn is not None and not self._conn.is_closed():
+            await self._conn.add_listener(channel, self._dispatch)
+
+    def remove_listener(self, channel, callback):
+        # LISTEN 自体は続ける (コールバックが無ければ何もしない)
+        callbacks = self._channels.get(channel, [])
+        if callback in callbacks: callbacks.remove(callback)
+
+    def add_reconnect_callback(self, callback):
+        self._reconnect_callbacks.append(callback)
+
+    def remove_reconnect_callback(self, callback):
+        if callback in self._reconnect_callbacks: self._reconnect_callbacks.remove(callback)
+
+    async def start(self):
+        # 各機能が状態を読み込む前に LISTEN を始めておく (読み込み中の変更を取りこぼさない)
+        await self._connect()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self._close_conn()
+
+    def _dispatch(self, conn, pid, channel, payload):
+        for callback in list(self._channels.get(channel, ())):
+            try: callback(payload)
+            except Exception as e: print(f'Notify callback error ({channel}): {e}')
+
+    def _on_terminate(self, conn):
+        if conn is self._conn: self._lost.set()
+
+    async def _connect(self):
+        conn = await asyncpg.connect(DATABASE_URL)
+        conn.add_termination_listener(self._on_terminate)
+        for channel in self._channels:
+            await conn.add_listener(channel, self._dispatch)
+        self._conn = conn
+
+    async def _close_conn(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            # 経路上で切られた接続は正常な切断の応答を待っても返らないので、待ちきれなければ打ち切る
+            try: await conn.close(timeout=LISTEN_RETRY_SECONDS)
+            except Exception: pass
+
+    async def _check(self):
+        # アイドル中に経路上で切られた接続は、何か送るまで検知できない
+        try: await asyncio.wait_for(self._lost.wait(), LISTEN_CHECK_SECONDS)
+        except asyncio.TimeoutError:
+            # 応答が返らない (切られたことに気付けていない) 接続も切断として扱う
+            try: await self._conn.fetchval("SELECT 1", timeout=LISTEN_CHECK_SECONDS)
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError): self._lost.set()
+
+    async def _run(self):
+        while True:
+            await self._check()
+            if not self._lost.is_set(): continue
+            self._lost.clear()
+            print('⚠️ LISTEN connection lost, reconnecting')
+            await self._close_conn()
+            while True:
+                try:
+                    await self._connect()
+                    break
+                except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                    print(f'LISTEN reconnect error: {e}')
+                    await asyncio.sleep(LISTEN_RETRY_SECONDS)
+            for callback in list(self._reconnect_callbacks):
+                try: await callback()
+                except Exception as e: print(f'Reconnect callback error: {e}')
@@ -0,0 +1,139 @@
+import os
+import asyncio
+import functools
+import time
+from collections import deque
+from aiohttp import web
+
+# ==========================================
+# 計測 (コマンド・各処理の所要時間とイベントループの遅延)
+# ==========================================
+# 指定した場合のみ、このポートで Prometheus 形式の /metrics を公開する
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = os.getenv('METRICS_PORT')
+# イベントループの遅延を測る間隔 (秒)
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.5'))
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """Prometheus 形式の累積バケットと、パーセンタイル計算用の直近サンプルを持つ"""
+    def __init__(self, samples=1024):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=samples)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+
+    def percentile(self, p):
+        if not self.recent: return 0.0
+        data = sorted(self.recent)
+        return data[min(len(data) - 1, int(len(data) * p / 100))]
+
+# (メトリクス名, ラベル名) -> {ラベル値: Histogram}
+FAMILIES = {
+    'command': ('chuly_command_duration_seconds', 'command', "スラッシュコマンドの処理時間"),
+    'subsystem': ('chuly_subsystem_duration_seconds', 'subsystem', "DB・yt-dlp・学習などの処理時間"),
+}
+histograms = {family: {} for family in FAMILIES}
+loop_lag = Histogram()
+last_loop_lag = 0.0
+
+def observe(family, name, seconds):
+    hist = histograms[family].get(name)
+    if hist is None:
+        hist = histograms[family][name] = Histogram()
+    hist.observe(seconds)
+
+def timed(family, name):
+    """関数の所要時間を記録するデコレータ (async / 通常の関数どちらにも使える)"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try: return await func(*args, **kwargs)
+                finally: observe(family, name, time.perf_counter() - started)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try: return func(*args, **kwargs)
+                finally: observe(family, name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def command(name):
+    # app_commands.command の内側 (関数の直上) に付ける
+    return timed('command', name)
+
+def subsystem(name):
+    return timed('subsystem', name)
+
+async def sample_loop_lag():
+    global last_loop_lag
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        last_loop_lag = max(0.0, loop.time() - expected)
+        loop_lag.observe(last_loop_lag)
+
+def _render_histogram(lines, metric, labels, hist):
+    cumulative = 0
+    for bound, n in zip(BUCKETS, hist.counts):
+        cumulative += n
+        lines.append(f'{metric}_bucket{{{labels}le="{bound}"}} {cumulative}')
+    lines.append(f'{metric}_bucket{{{labels}le="+Inf"}} {hist.count}')
+    lines.append(f'{metric}_sum{{{labels.rstrip(",")}}} {hist.sum}')
+    lines.append(f'{metric}_count{{{labels.rstrip(",")}}} {hist.count}')
+
+def render():
+    lines = []
+    for family, (metric, label, help_text) in FAMILIES.items():
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} histogram")
+        for name, hist in sorted(histograms[family].items()):
+            _render_histogram(lines, metric, f'{label}="{name}",', hist)
+    lines.append("# HELP chuly_event_loop_lag_seconds イベントループの遅延")
+    lines.append("# TYPE chuly_event_loop_lag_seconds histogram")
+    _render_histogram(lines, 'chuly_event_loop_lag_seconds', '', loop_lag)
+    return "\n".join(lines) + "\n"
+
+def command_percentiles(limit=10):
+    # 呼び出し回数の多い順に (コマンド名, p50, p95, p99) を秒で返す
+    items = sorted(histograms['command'].items(), key=lambda kv: kv[1].count, reverse=True)[:limit]
+    return [(name, h.percentile(50), h.percentile(95), h.percentile(99)) for name, h in items]
+
+class MetricsService:
+    def __init__(self):
+        self._lag_task = None
+        self._runner = None
+
+    async def start(self):
+        self._lag_task = asyncio.create_task(sample_loop_lag())
+        if METRICS_PORT:
+            app = web.Application()
+            app.router.add_get('/metrics', self._handle)
+            self._runner = web.AppRunner(app)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, METRICS_HOST, int(METRICS_PORT)).start()
+
+    async def stop(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request):
+        return web.Response(text=render(), content_type='text/plain', charset='utf-8')
@@ -0,0 +1,193 @@
+import os
+import json
+import pickle
+import threading
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from history_store import HistoryStore, to_micros
+
+# ==========================================
+# 株価予測モデル (計算用プロセス内でのみ import される)
+# ==========================================
+FEATURES = ['month', 'day', 'hour', 'deviation', 'momentum']
+# 前回学習から何件増えたら再学習するか
+MODEL_REFIT_ROWS = int(os.getenv('MODEL_REFIT_ROWS', '20'))
+# 学習済みモデルが無いとき、この件数までは予測の中で学習する (それより多ければ裏で学習し、終わるまでは学習中と返す)
+MODEL_INLINE_FIT_ROWS = int(os.getenv('MODEL_INLINE_FIT_ROWS', '20000'))
+
+class PriceModel:
+    """列指向スナップショットの末尾だけを見て、指標を1件あたり O(1) で更新する。
+
+    学習済みモデルはキャッシュし、MODEL_REFIT_ROWS 件増えたとき (または定期タスク) にだけ再学習する。
+    再学習は別スレッドで行い、終わるまでは前のモデルで予測する。モデルはスナップショットの隣に保存し、
+    再起動後も学習し直さずに使う。
+    """
+    WINDOW = 15  # RSI(14) に必要な価格数
+
+    def __init__(self, path):
+        self.store = HistoryStore(path)
+        self.model = None
+        self.trained_rows = 0
+        # 学習に使った行が削除・書き換えられた (次の機会に学習し直す。それまでは今のモデルを使う)
+        self.stale = False
+        self._truncated = []   # 学習中に切り詰めた件数 (学習範囲の行が消えたかを見る)
+        self._refit_thread = None
+        self._lock = threading.Lock()
+        self._load_model()
+
+    def _model_file(self, ext):
+        return os.path.join(self.store.path, f"model.{ext}")
+
+    def _load_model(self):
+        try:
+            with open(self._model_file('json'), encoding='utf-8') as f: meta = json.load(f)
+            with open(self._model_file('pkl'), 'rb') as f: model = pickle.load(f)
+        except (OSError, ValueError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return
+        n = meta['trained_rows']
+        # 停止中にスナップショットの方が短くなった・書き換わった場合は、使いつつ学習し直す
+        same = 0 < n <= self.count and int(self.store.column('timestamp')[n - 1]) == meta['last_timestamp']
+        self.model, self.trained_rows, self.stale = model, n, meta['stale'] or not same
+
+    def _save_meta(self):
+        n = self.trained_rows
+        meta = {'trained_rows': n, 'last_timestamp': int(self.store.column('timestamp')[n - 1]) if 0 < n <= self.count else None, 'stale': self.stale}
+        tmp = self._model_file('json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f: json.dump(meta, f)
+        os.replace(tmp, self._model_file('json'))
+
+    def _save_model(self, model):
+        tmp = self._model_file('pkl.tmp')
+        with open(tmp, 'wb') as f: pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._model_file('pkl'))
+        self._save_meta()
+
+    @property
+    def count(self):
+        return self.store.count
+
+    def _recent(self, k):
+        # 古い順に直近 k 件の価格を返す
+        return self.store.column('price')[self.count - k:self.count]
+
+    def sync(self, max_timestamp, changed_since=None):
+        # DB 側で削除された末尾の行と、changed_since 以降 (取り込みで書き換わった範囲) を落とす。
+        # max_timestamp が None (DB が空) なら空にする
+        n = self.store.count_until(max_timestamp) if max_timestamp is not None else 0
+        if changed_since is not None: n = min(n, self.store.count_before(changed_since))
+        if n != self.count:
+            with self._lock:
+                self.store.truncate(n)
+                self._truncated.append(n)
+                # 学習に使った行が消えても、再学習が終わるまでは今のモデルで予測する
+                if n < self.trained_rows and self.model is not None and not self.stale:
+                    self.stale = True
+                    self._save_meta()
+        return self.count, self.store.last_timestamp()
+
+    def append(self, rows):
+        # rows: timestamp 昇順の (timestamp, price, month, day, hour, deviation, momentum)
+        # 特徴量が未保存の行はここで計算し、DB に書き戻す分 (ma5, deviation, momentum, timestamp) を返す
+        if not rows: return []
+        ts, price, month, day, hour, deviation, momentum = zip(*rows)
+        price = np.asarray(price, dtype=np.float64)
+        deviation = np.array([np.nan if v is None else v for v in deviation])
+        momentum = np.array([np.nan if v is None else v for v in momentum])
+        missing = np.isnan(deviation) | np.isnan(momentum)
+        backfill = []
+        if missing.any():
+            # 直前4件を前に付けて、移動平均と3件前との差をまとめて計算する
+            prefix = self._recent(min(self.count, 4))
+            p = np.concatenate([prefix, price])
+            j = np.arange(len(prefix), len(p))
+            cs = np.concatenate([[0.0], np.cumsum(p)])
+            start = np.maximum(j - 4, 0)
+            ma5 = (cs[j + 1] - cs[start]) / (j + 1 - start)
+            calc_dev = (price - ma5) / ma5 * 100
+            calc_mom = np.where(self.count + np.arange(len(price)) >= 3, price - p[np.maximum(j - 3, 0)], 0.0)
+            deviation = np.where(missing, calc_dev, deviation)
+            momentum = np.where(missing, calc_mom, momentum)
+            backfill = [(float(ma5[i]), float(deviation[i]), float(momentum[i]), ts[i]) for i in np.flatnonzero(missing)]
+        self.store.append({
+            'timestamp': [to_micros(t) for t in ts], 'price': price,
+            'month': month, 'day': day, 'hour': hour,
+            'deviation': deviation, 'momentum': momentum,
+        })
+        return backfill
+
+    def push(self, timestamp, price, month, day, hour):
+        ma5, deviation, momentum, _ = self.append([(timestamp, price, month, day, hour, None, None)])[0]
+        return ma5, deviation, momentum
+
+    def needs_refit(self):
+        return self.count >= 10 and (self.model is None or self.stale or self.count - self.trained_rows >= MODEL_REFIT_ROWS)
+
+    @property
+    def refitting(self):
+        return self._refit_thread is not None and self._refit_thread.is_alive()
+
+    def _training_data(self):
+        # 学習中にスナップショットが切り詰められても困らないよう、memmap から複製しておく
+        if not self.refitting: self._truncated.clear()
+        n = self.count
+        X = np.column_stack([self.store.column(name)[:n] for name in FEATURES])
+        return n, X, np.array(self.store.column('price')[:n]), len(self._truncated)
+
+    def _fit(self, n, X, y, since):
+        model = RandomForestRegressor(n_estimators=50, max_depth=7, random_state=42)
+        model.fit(X, y)
+        with self._lock:
+            # 学習中に学習範囲の行が消えていれば、このモデルも古いものとして扱う
+            self.model, self.trained_rows = model, n
+            self.stale = min(self._truncated[since:], default=n) < n
+            self._save_model(model)
+
+    def refit(self):
+        self._fit(*self._training_data())
+
+    def start_refit(self):
+        # 裏のスレッドで学習する (木の構築中は GIL を手放すので、その間も予測に応えられる)
+        if self.refitting: return False
+        self._refit_thread = threading.Thread(target=self._refit_in_background, args=self._training_data(), daemon=True)
+        self._refit_thread.start()
+        return True
+
+    def _refit_in_background(self, *args):
+        try: self._fit(*args)
+        except Exception as e: print(f'Model refit error: {e!r}')
+
+    def rsi(self):
+        n = min(self.count, self.WINDOW)
+        delta = np.diff(self._recent(n))
+        # 先頭の差分 (NaN) を 0 として含めた直近 min(件数, 14) 件の平均
+        window = min(self.count, 14)
+        gain = delta[delta > 0].sum() / window
+        loss = -delta[delta < 0].sum() / window
+        return 100.0 - (100.0 / (1.0 + (gain / loss))) if loss != 0 else 50.0
+
+    def analyze(self, month, day, hour):
+        if self.count < 10: return f"蓄積中({self.count}/10)", 0, 50, 0.0
+        try:
+            if self.model is None:
+                if self.count > MODEL_INLINE_FIT_ROWS:
+                    # 件数が多いと学習に数分かかるので、予測の中では待たない
+                    self.start_refit()
+                    return "AI学習中", 0, int(round(self.rsi())), 0.0
+                self.refit()
+            elif self.needs_refit():
+                self.start_refit()
+            last = self.count - 1
+            current_features = np.array([[month, day, hour, self.store.column('deviation')[last], self.store.column('momentum')[last]]])
+            pred_raw = self.model.predict(current_features)[0]
+            rsi = self.rsi()
+            diff = int(round(pred_raw - self.store.column('price')[last]))
+            score = 0.0
+            if diff >= 1: score += 1.0
+            if rsi < 35: score += 1.5
+            if rsi > 65: score -= 1.5
+            if diff >= 5 or score >= 2.5: status = "強力な上昇サイン 🚀"
+            elif diff >= 1: status = "緩やかな上昇見込み 📈"
+            elif diff <= -5 or score <= -2.5: status = "下落注意 📉"
+            else: status = "方向感の探り合い ➡️"
+            return status, diff, int(round(rsi)), score
+        except: return "AI調整中", 0, 50, 0.0
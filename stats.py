@@ -0,0 +1,69 @@
+import os
+import asyncio
+from collections import deque
+import db
+import metrics
+
+# ==========================================
+# /status 用のシステム統計 (バックグラウンドで定期的に採取)
+# ==========================================
+# 採取間隔 (秒) と保持件数。既定では直近10分を10秒刻みで持つ
+STATS_INTERVAL = float(os.getenv('STATS_INTERVAL', '10'))
+STATS_HISTORY = int(os.getenv('STATS_HISTORY', '60'))
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+def sparkline(values):
+    if not values: return ""
+    lo, hi = min(values), max(values)
+    if hi == lo: return SPARK_CHARS[0] * len(values)
+    return "".join(SPARK_CHARS[int((v - lo) / (hi - lo) * (len(SPARK_CHARS) - 1))] for v in values)
+
+class StatsSampler:
+    """CPU・メモリ・ループ遅延などを一定間隔でリングバッファに記録する。
+
+    /status はここの記録を表示するだけなので、呼び出しごとのシステムコールや DB 問い合わせが無い。
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self.samples = deque(maxlen=STATS_HISTORY)
+        self._task = None
+
+    @property
+    def latest(self):
+        return self.samples[-1] if self.samples else None
+
+    def series(self, key):
+        return [s[key] for s in self.samples if s[key] is not None]
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _sample(self, psutil, process):
+        pool = db.db_pool
+        try: history = await db.get_history_count()
+        except Exception: history = db.history_row_count
+        return {
+            # interval を指定しないので、前回の採取からの平均使用率になる
+            'cpu': psutil.cpu_percent(interval=None),
+            'rss': process.memory_info().rss,
+            'loop_lag': metrics.last_loop_lag,
+            'voice_clients': len(self.bot.voice_clients),
+            'pool_used': pool.get_size() - pool.get_idle_size() if pool is not None else None,
+            'pool_size': pool.get_size() if pool is not None else None,
+            'history': history,
+        }
+
+    async def _run(self):
+        import psutil
+        process = psutil.Process()
+        # 初回の cpu_percent は 0.0 を返すので、ここで基準点を取っておく
+        psutil.cpu_percent(interval=None)
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            try: self.samples.append(await self._sample(psutil, process))
+            except Exception as e: print(f'Stats sample error: {e}')
@@ -0,0 +1,42 @@
+import os
+import sys
+import time
+import threading
+import pytest
+
+# リポジトリ直下のモジュール (db.py, cogs/ など) を import できるようにする
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Postgres が必要なテストは TEST_DATABASE_URL を指定したときだけ実行する
+# (config.DATABASE_URL は import 時に読まれるので、ここで差し替えておく)
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+if TEST_DATABASE_URL:
+    os.environ['DATABASE_URL'] = TEST_DATABASE_URL
+
+@pytest.fixture
+def database_url():
+    if not TEST_DATABASE_URL: pytest.skip("TEST_DATABASE_URL が未設定")
+    return TEST_DATABASE_URL
+
+# yt-dlp の代わり (delay 秒かけて、同じ動画の抽出結果を返す)
+class StubYTDL:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def extract_info(self, query, download=False):
+        with self._lock: self.calls.append(query)
+        time.sleep(self.delay)
+        return {'entries': [{'id': 'dQw4w9WgXcQ', 'title': 'song', 'ext': 'm4a', 'duration': 212, 'formats': ['big'],
+                             'webpage_url': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+                             'url': f"https://r1.googlevideo.com/videoplayback?expire={int(time.time()) + 3600}"}]}
+
+@pytest.fixture
+def stub_ytdl(monkeypatch):
+    from cogs import music
+    stub = StubYTDL(delay=0.05)
+    monkeypatch.setattr(music, 'get_ytdl', lambda: stub)
+    return stub
@@ -0,0 +1,161 @@
+import asyncio
+import time
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp import web
+
+# ==========================================
+# Annict クライアント (ローカルのスタブサーバー相手に TTL・stale-while-revalidate を確かめる)
+# ==========================================
+LATENCY = 0.1
+
+class StubAnnict:
+    def __init__(self, latency=LATENCY):
+        self.latency = latency
+        self.requests = []
+        self.version = 1
+        self.fail = False
+
+    async def works(self, request):
+        self.requests.append(dict(request.query))
+        await asyncio.sleep(self.latency)
+        if self.fail: return web.Response(status=500)
+        key = request.query.get('filter_season') or request.query.get('filter_title')
+        return web.json_response({'works': [{'title': f"{key} v{self.version}"}]})
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get('/v1/works', self.works)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/v1/works"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
+
+def run_with_client(scenario, *, token=None, **options):
+    from annict import AnnictClient
+
+    async def run():
+        async with StubAnnict() as stub:
+            client = AnnictClient(token, base_url=stub.url, **options)
+            try: return await scenario(stub, client)
+            finally: await client.close()
+    return asyncio.run(run())
+
+async def timed(coro):
+    started = time.perf_counter()
+    result = await coro
+    return result, time.perf_counter() - started
+
+def test_cold_and_warm_latency():
+    async def scenario(stub, client):
+        cold, cold_s = await timed(client.season_ranking('2026-spring'))
+        warm, warm_s = await timed(client.season_ranking('2026-spring'))
+        return stub, cold, cold_s, warm, warm_s
+
+    stub, cold, cold_s, warm, warm_s = run_with_client(scenario)
+    print(f"\nAnnict cold {cold_s * 1000:.1f}ms / warm {warm_s * 1000:.3f}ms")
+    assert cold == warm == [{'title': '2026-spring v1'}]
+    assert len(stub.requests) == 1
+    assert cold_s >= LATENCY
+    assert warm_s < LATENCY / 10
+
+def test_params_and_token():
+    async def scenario(stub, client):
+        await client.season_ranking('2026-fall', per_page=5)
+        await client.search('  Frieren ')
+        return stub.requests
+
+    # トークン未設定なら access_token を付けない
+    season, search = run_with_client(scenario)
+    assert season == {'filter_season': '2026-fall', 'sort_watchers_count': 'desc', 'per_page': '5'}
+    assert search == {'filter_title': '  Frieren ', 'per_page': '3'}
+    assert run_with_client(scenario, token='secret')[0]['access_token'] == 'secret'
+
+def test_search_key_is_normalised():
+    async def scenario(stub, client):
+        await client.search('Frieren')
+        await client.search('  frieren ')
+        return stub.requests
+
+    assert len(run_with_client(scenario)) == 1
+
+def test_concurrent_misses_are_coalesced():
+    async def scenario(stub, client):
+        results = await asyncio.gather(*(client.season_ranking('2026-summer') for _ in range(10)))
+        return stub.requests, results
+
+    requests, results = run_with_client(scenario)
+    assert len(requests) == 1
+    assert all(r == results[0] for r in results)
+
+def test_stale_while_revalidate():
+    async def scenario(stub, client):
+        await client.season_ranking('2026-winter')
+        stub.version = 2
+        await asyncio.sleep(0.25)
+        # TTL 切れ: 古い結果を待たずに返し、裏で取り直す
+        stale, stale_s = await timed(client.season_ranking('2026-winter'))
+        await asyncio.sleep(LATENCY * 2)
+        fresh = await client.season_ranking('2026-winter')
+        return stub.requests, stale, stale_s, fresh
+
+    requests, stale, stale_s, fresh = run_with_client(scenario, ttl=0.2, stale_ttl=60)
+    assert stale == [{'title': '2026-winter v1'}]
+    assert stale_s < LATENCY / 2
+    assert fresh == [{'title': '2026-winter v2'}]
+    assert len(requests) == 2
+
+def test_expired_entry_is_refetched_and_failures_keep_stale():
+    async def scenario(stub, client):
+        await client.season_ranking('2026-spring')
+        stub.fail = True
+        await asyncio.sleep(0.25)
+        # 裏での取り直しが失敗しても古い結果を返し続ける
+        stale = await client.season_ranking('2026-spring')
+        await asyncio.sleep(LATENCY * 2)
+        still_stale = await client.season_ranking('2026-spring')
+        await asyncio.sleep(0.35)
+        # stale_ttl も過ぎたら待って取り直す (失敗はそのまま呼び出し元へ)
+        with pytest.raises(aiohttp.ClientResponseError):
+            await client.season_ranking('2026-spring')
+        return stale, still_stale
+
+    stale, still_stale = run_with_client(scenario, ttl=0.2, stale_ttl=0.6)
+    assert stale == still_stale == [{'title': '2026-spring v1'}]
+
+def test_cache_is_bounded():
+    async def scenario(stub, client):
+        for season in ('a', 'b', 'c', 'a'):
+            await client.season_ranking(season)
+        return [r['filter_season'] for r in stub.requests]
+
+    assert run_with_client(scenario, maxsize=2) == ['a', 'b', 'c', 'a']
+
+def test_service_defers_before_searching():
+    pytest.importorskip('discord')
+    from types import SimpleNamespace
+    from bench.replay import fake_interaction, FakeGuild
+    from cogs.anime import Anime
+
+    async def scenario(stub, client):
+        cog = Anime(SimpleNamespace())
+        await cog.annict_client.close()
+        cog.annict_client = client
+        interaction = fake_interaction(1, FakeGuild(1), 0)
+        search = asyncio.create_task(cog.service.callback(cog, interaction, "まどか"))
+        # 検索が終わる前に応答を保留しておく (3秒以内に応答しないとインタラクションが失効する)
+        await asyncio.sleep(LATENCY / 2)
+        deferred = interaction.response.is_done()
+        await search
+        return deferred, interaction
+
+    deferred, interaction = run_with_client(scenario)
+    assert deferred and interaction.response.messages == []
+    [(content, kwargs)] = interaction.followup.messages
+    assert [e.title for e in kwargs['embeds']] == ["まどか v1"]
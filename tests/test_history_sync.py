@@ -0,0 +1,109 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+import pytest
+
+np = pytest.importorskip('numpy')
+
+# ==========================================
+# 一括取り込み (窓関数での特徴量計算) とスナップショットの差分同期
+# ==========================================
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def make_records(slots, seed):
+    from config import timezone_jp
+    rng = random.Random(seed)
+    out = []
+    for slot in slots:
+        ts = START + timedelta(minutes=10 * slot)
+        local = ts.astimezone(timezone_jp)
+        out.append((ts, round(100 + rng.uniform(-20, 20), 1), local.month, local.day, local.hour, None))
+    return out
+
+async def _reset():
+    import db
+    await db.init_db()
+    async with db.get_db_connection() as conn:
+        await conn.execute("TRUNCATE history")
+
+async def _ingest(records):
+    import db
+    from ingest import ingest_records
+    async with db.get_db_connection() as conn:
+        return await ingest_records(conn, iter(records))
+
+async def _db_rows():
+    import db
+    async with db.get_db_connection() as conn:
+        return await conn.fetch("SELECT timestamp, price, month, day, hour, ma5, deviation, momentum FROM history ORDER BY timestamp")
+
+def expected_features(rows, path):
+    # 特徴量を持たない状態から PriceModel で計算した値 (ボット側の計算式) を正とする
+    from price_model import PriceModel
+    model = PriceModel(str(path))
+    backfill = model.append([(r['timestamp'], r['price'], r['month'], r['day'], r['hour'], None, None) for r in rows])
+    return np.array([b[:3] for b in backfill])
+
+def test_ingest_features_match_price_model(database_url, tmp_path):
+    pytest.importorskip('sklearn')
+    import db
+
+    async def run():
+        await db.init_db_pool()
+        try:
+            await _reset()
+            # 偶数の枠を先に取り込み、後から奇数の枠を途中から差し込む (途中からの再計算になる)
+            await _ingest(make_records(range(0, 400, 2), seed=1))
+            _, earliest = await _ingest(make_records(range(201, 400, 2), seed=2))
+            assert earliest == START + timedelta(minutes=10 * 201)
+            return await _db_rows()
+        finally:
+            await db.close_db_pool()
+
+    rows = asyncio.run(run())
+    assert len(rows) == 300
+    actual = np.array([(r['ma5'], r['deviation'], r['momentum']) for r in rows])
+    np.testing.assert_allclose(actual, expected_features(rows, tmp_path / 'expected'), rtol=1e-9, atol=1e-9)
+
+def test_snapshot_resyncs_only_the_changed_range(database_url, tmp_path, monkeypatch):
+    pytest.importorskip('sklearn')
+    monkeypatch.setenv('HISTORY_SNAPSHOT_DIR', str(tmp_path / 'snapshot'))
+    monkeypatch.delenv('SHARD_IDS', raising=False)
+    import db
+    from history_store import HistoryStore, to_micros
+    from cogs.prediction import ComputeExecutor, PriceAnalytics
+
+    async def run():
+        await db.init_db_pool()
+        executor = ComputeExecutor()
+        executor.start()
+        try:
+            await _reset()
+            await _ingest(make_records(range(0, 600, 2), seed=3))
+            analytics = PriceAnalytics(executor)
+            await analytics.ensure_loaded()
+            assert analytics.count == 300
+
+            # 取り込み通知を受けたときと同じく、変更のあった時刻以降だけを読み直させる
+            loads = []
+            original = analytics._load_after
+            async def recording_load_after(last_ts):
+                loads.append(last_ts)
+                return await original(last_ts)
+            analytics._load_after = recording_load_after
+            _, earliest = await _ingest(make_records(range(401, 600, 2), seed=4))
+            analytics.invalidate(earliest)
+            await analytics.ensure_loaded()
+            assert analytics.count == 400
+            assert loads == [START + timedelta(minutes=10 * 400)]
+            return await _db_rows()
+        finally:
+            executor.shutdown()
+            await db.close_db_pool()
+
+    rows = asyncio.run(run())
+    store = HistoryStore(str(tmp_path / 'snapshot' / 'shard-main'))
+    assert store.count == len(rows)
+    np.testing.assert_array_equal(store.column('timestamp'), [to_micros(r['timestamp']) for r in rows])
+    np.testing.assert_allclose(store.column('deviation'), [r['deviation'] for r in rows], rtol=1e-9)
+    np.testing.assert_allclose(store.column('momentum'), [r['momentum'] for r in rows], rtol=1e-9, atol=1e-9)
@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+
+pytest.importorskip('asyncpg')
+
+# ==========================================
+# 専用接続の生存確認 (応答が返らない接続を切断として扱うこと)
+# ==========================================
+class HangingConnection:
+    # 経路上で切られた接続の代わり。問い合わせにも切断にも応答しない (timeout を渡したときだけ諦める)
+    def __init__(self):
+        self.closed = False
+
+    def is_closed(self):
+        return self.closed
+
+    async def fetchval(self, query, *args, timeout=None):
+        await asyncio.wait_for(asyncio.Event().wait(), timeout)
+
+    async def close(self, timeout=None):
+        try: await asyncio.wait_for(asyncio.Event().wait(), timeout)
+        finally: self.closed = True
+
+def test_listener_check_times_out_on_unresponsive_connection(monkeypatch):
+    import listener
+    monkeypatch.setattr(listener, 'LISTEN_CHECK_SECONDS', 0.05)
+    monkeypatch.setattr(listener, 'LISTEN_RETRY_SECONDS', 0.05)
+
+    async def run():
+        notify = listener.NotifyListener()
+        conn = notify._conn = HangingConnection()
+        await asyncio.wait_for(notify._check(), 2)
+        lost = notify._lost.is_set()
+        await asyncio.wait_for(notify._close_conn(), 2)
+        return lost, conn
+
+    lost, conn = asyncio.run(run())
+    assert lost and conn.closed
+
+def test_leader_steps_down_on_unresponsive_connection(monkeypatch):
+    import leader
+    monkeypatch.setattr(leader, 'LEADER_RETRY_SECONDS', 0.05)
+
+    async def run():
+        election = leader.LeaderElection()
+        changes = []
+
+        async def on_change(is_leader): changes.append(is_leader)
+        election.add_listener(on_change)
+        election.is_leader = True
+        conn = election._conn = HangingConnection()
+        task = asyncio.create_task(election._run())
+        try:
+            while election._conn is not None: await asyncio.sleep(0.01)
+        finally:
+            task.cancel()
+        return changes, conn, election
+
+    changes, conn, election = asyncio.run(asyncio.wait_for(run(), 2))
+    assert changes == [False] and not election.is_leader
+    assert conn.closed
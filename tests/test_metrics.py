@@ -0,0 +1,106 @@
+import asyncio
+import socket
+import pytest
+
+pytest.importorskip('aiohttp')
+
+# ==========================================
+# 計測 (ヒストグラム・デコレータ・Prometheus 形式の出力)
+# ==========================================
+@pytest.fixture
+def metrics(monkeypatch):
+    import metrics
+    # モジュール全体で共有している集計をテストごとに空にする
+    monkeypatch.setattr(metrics, 'histograms', {family: {} for family in metrics.FAMILIES})
+    monkeypatch.setattr(metrics, 'loop_lag', metrics.Histogram())
+    return metrics
+
+def test_histogram_buckets_and_percentiles(metrics):
+    hist = metrics.Histogram(samples=4)
+    for seconds in (0.001, 0.02, 0.02, 0.3, 100.0):
+        hist.observe(seconds)
+    assert hist.count == 5
+    assert hist.sum == pytest.approx(100.341)
+    assert hist.counts[metrics.BUCKETS.index(0.005)] == 1
+    assert hist.counts[metrics.BUCKETS.index(0.025)] == 2
+    assert hist.counts[metrics.BUCKETS.index(0.5)] == 1
+    # 上限を超えた値はどのバケットにも入らない (+Inf でだけ数える)
+    assert sum(hist.counts) == 4
+    # パーセンタイルは直近 samples 件から出す
+    assert hist.percentile(50) == 0.3
+    assert hist.percentile(99) == 100.0
+    assert metrics.Histogram().percentile(50) == 0.0
+
+def test_timed_records_sync_async_and_failures(metrics):
+    @metrics.subsystem('sync')
+    def work(x): return x * 2
+
+    @metrics.command('ping')
+    async def ping(): return 'pong'
+
+    @metrics.subsystem('broken')
+    async def broken(): raise ValueError('x')
+
+    assert work(2) == 4
+    assert asyncio.run(ping()) == 'pong'
+    with pytest.raises(ValueError):
+        asyncio.run(broken())
+    assert work.__name__ == 'work' and ping.__name__ == 'ping'
+    assert metrics.histograms['subsystem']['sync'].count == 1
+    assert metrics.histograms['subsystem']['broken'].count == 1
+    assert metrics.histograms['command']['ping'].count == 1
+
+def test_render(metrics):
+    metrics.observe('command', 'status', 0.003)
+    metrics.observe('command', 'status', 0.2)
+    metrics.observe('command', 'anime', 0.04)
+    metrics.loop_lag.observe(0.001)
+    lines = metrics.render().splitlines()
+
+    assert lines[0] == "# HELP chuly_command_duration_seconds スラッシュコマンドの処理時間"
+    assert lines[1] == "# TYPE chuly_command_duration_seconds histogram"
+    # ラベル値の順に並び、バケットは累積で数える
+    assert lines[2] == 'chuly_command_duration_seconds_bucket{command="anime",le="0.005"} 0'
+    assert 'chuly_command_duration_seconds_bucket{command="anime",le="0.05"} 1' in lines
+    assert 'chuly_command_duration_seconds_bucket{command="status",le="0.005"} 1' in lines
+    assert 'chuly_command_duration_seconds_bucket{command="status",le="0.1"} 1' in lines
+    assert 'chuly_command_duration_seconds_bucket{command="status",le="0.25"} 2' in lines
+    assert 'chuly_command_duration_seconds_bucket{command="status",le="+Inf"} 2' in lines
+    assert 'chuly_command_duration_seconds_sum{command="status"} 0.203' in lines
+    assert 'chuly_command_duration_seconds_count{command="status"} 2' in lines
+    assert "# TYPE chuly_subsystem_duration_seconds histogram" in lines
+    # ラベルの無い系列は {} のまま出す
+    assert 'chuly_event_loop_lag_seconds_bucket{le="0.005"} 1' in lines
+    assert 'chuly_event_loop_lag_seconds_sum{} 0.001' in lines
+    assert 'chuly_event_loop_lag_seconds_count{} 1' in lines
+    assert metrics.render().endswith("\n")
+    assert sum(1 for line in lines if line.startswith('chuly_command_duration_seconds_bucket')) == 2 * (len(metrics.BUCKETS) + 1)
+
+def test_command_percentiles_are_ordered_by_calls(metrics):
+    for _ in range(3): metrics.observe('command', 'remind', 0.01)
+    metrics.observe('command', 'music', 2.0)
+    assert metrics.command_percentiles() == [('remind', 0.01, 0.01, 0.01), ('music', 2.0, 2.0, 2.0)]
+    assert metrics.command_percentiles(limit=1) == [('remind', 0.01, 0.01, 0.01)]
+
+def test_http_endpoint(metrics, monkeypatch):
+    import aiohttp
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    monkeypatch.setattr(metrics, 'METRICS_PORT', str(port))
+    metrics.observe('command', 'status', 0.01)
+
+    async def run():
+        service = metrics.MetricsService()
+        await service.start()
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{port}/metrics") as res:
+                    return res.status, res.headers['Content-Type'], await res.text()
+        finally:
+            await service.stop()
+
+    status, content_type, body = asyncio.run(run())
+    assert status == 200
+    assert content_type.startswith('text/plain')
+    assert 'chuly_command_duration_seconds_count{command="status"} 1' in body
@@ -0,0 +1,189 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+
+discord = pytest.importorskip('discord')
+
+from conftest import StubYTDL
+
+# ==========================================
+# GuildPlayer (先読み・取得失敗時の次の曲・/stop の後始末・再生開始までの時間)
+# ==========================================
+class FakeAudio(discord.AudioSource):
+    # FFmpegPCMAudio の代わり (プロセスは起動せず、cleanup の回数だけ数える)
+    created = []
+
+    def __init__(self, url, **kwargs):
+        self.url = url
+        self.cleaned = 0
+        FakeAudio.created.append(self)
+
+    def read(self):
+        return b''
+
+    def cleanup(self):
+        self.cleaned += 1
+
+class TitledYTDL(StubYTDL):
+    # クエリごとに別の曲を返し、failing に含まれるクエリは抽出に失敗する
+    def __init__(self, delay=0.0, failing=()):
+        super().__init__(delay)
+        self.failing = set(failing)
+
+    def extract_info(self, query, download=False):
+        data = super().extract_info(query, download)
+        if query in self.failing: raise RuntimeError(f"unavailable: {query}")
+        entry = data['entries'][0]
+        entry.update(id=query, title=query, webpage_url=f"https://example.com/{query}")
+        return data
+
+@pytest.fixture
+def music(monkeypatch):
+    from cogs import music
+    FakeAudio.created = []
+    monkeypatch.setattr(music.discord, 'FFmpegPCMAudio', FakeAudio)
+    # テストごとに空のキャッシュから始める
+    monkeypatch.setattr(music, 'ytdl_cache', music.ExtractionCache(16))
+    return music
+
+def use_ytdl(monkeypatch, music, **kwargs):
+    stub = TitledYTDL(**kwargs)
+    monkeypatch.setattr(music, 'get_ytdl', lambda: stub)
+    return stub
+
+def new_player(music):
+    from bench.replay import FakeGuild, FakeVoiceChannel, FakeVoiceClient
+    guild = FakeGuild(1)
+    guild.voice_client = FakeVoiceClient(guild, FakeVoiceChannel(guild))
+    return music.GuildPlayer(guild, asyncio.get_running_loop())
+
+async def finish(player):
+    # 再生中の曲が終わったことにして、次の曲を始める
+    player.guild.voice_client.stop()
+    return await player.play_next()
+
+def test_prefetched_entry_is_used(music, monkeypatch):
+    stub = use_ytdl(monkeypatch, music)
+
+    async def run():
+        player = new_player(music)
+        player.enqueue('a'); player.enqueue('b')
+        first = await player.play_next()
+        # 再生を始めたら、次の曲を先に取得しておく
+        assert player._prefetch is not None and player._prefetch[0] is player.queue[0]
+        prefetched = await player._prefetch[1]
+        second = await finish(player)
+        return first, prefetched, second, player
+
+    first, prefetched, second, player = asyncio.run(run())
+    assert (first.title, second.title) == ('a', 'b')
+    assert second is prefetched
+    assert stub.calls == ['a', 'b'] and len(FakeAudio.created) == 2
+    assert player._prefetch is None and not player.queue
+
+def test_entry_without_prefetch_is_fetched(music, monkeypatch):
+    stub = use_ytdl(monkeypatch, music)
+
+    async def run():
+        player = new_player(music)
+        player.enqueue('a')
+        first = await player.play_next()
+        # 先読みの後に追加された曲は、その場で取得する
+        player.enqueue('b')
+        assert player._prefetch is None
+        return first, await finish(player)
+
+    first, second = asyncio.run(run())
+    assert (first.title, second.title) == ('a', 'b')
+    assert stub.calls == ['a', 'b'] and len(FakeAudio.created) == 2
+
+def test_failed_extraction_falls_through_to_next_entry(music, monkeypatch):
+    stub = use_ytdl(monkeypatch, music, failing={'broken', 'gone'})
+
+    async def run():
+        player = new_player(music)
+        for query in ('broken', 'a', 'gone', 'c'): player.enqueue(query)
+        # 取得に失敗した曲は飛ばして次の曲を再生する
+        first = await player.play_next()
+        # 先読みで失敗した曲も同じく飛ばす
+        with pytest.raises(RuntimeError):
+            await player._prefetch[1]
+        second = await finish(player)
+        return first, second, player
+
+    first, second, player = asyncio.run(run())
+    assert (first.title, second.title) == ('a', 'c')
+    assert str(player.last_error) == "unavailable: gone"
+    assert stub.calls == ['broken', 'a', 'gone', 'c']
+    # すべて失敗すれば何も再生しない
+    use_ytdl(monkeypatch, music, failing={'x'})
+
+    async def run_all_failing():
+        player = new_player(music)
+        player.enqueue('x')
+        return await player.play_next(), player
+
+    source, player = asyncio.run(run_all_failing())
+    assert source is None and player.current is None and isinstance(player.last_error, RuntimeError)
+
+def test_stop_cleans_up_prefetched_source(music, monkeypatch):
+    from bench.replay import fake_interaction
+    use_ytdl(monkeypatch, music)
+
+    async def run():
+        cog = music.Music(SimpleNamespace(loop=asyncio.get_running_loop()))
+        player = new_player(music)
+        cog.players[player.guild.id] = player
+        player.enqueue('a'); player.enqueue('b')
+        await player.play_next()
+        prefetched = await player._prefetch[1]
+        interaction = fake_interaction(2, player.guild, 0)
+        await cog.stop.callback(cog, interaction)
+        return prefetched, cog, player, interaction
+
+    prefetched, cog, player, interaction = asyncio.run(run())
+    # 先読みで起動した FFmpeg を止め、キューとボイス接続を片付ける
+    assert prefetched.original.cleaned == 1
+    assert player._prefetch is None and not player.queue
+    assert cog.players == {} and player.guild.voice_client is None
+    assert interaction.response.messages == [("👋 退出しました。", {})]
+
+def test_clear_cancels_pending_prefetch(music, monkeypatch):
+    use_ytdl(monkeypatch, music, delay=0.2)
+
+    async def run():
+        player = new_player(music)
+        player.enqueue('a')
+        player.prefetch()
+        task = player._prefetch[1]
+        await asyncio.sleep(0)
+        player.clear()
+        await asyncio.sleep(0)
+        return task
+
+    task = asyncio.run(run())
+    assert task.cancelled()
+
+def test_ttfa_is_measured_from_request_or_previous_track_end(music, monkeypatch):
+    use_ytdl(monkeypatch, music, delay=0.05)
+
+    async def run():
+        player = new_player(music)
+        player.enqueue('a')
+        first = await player.play_next()
+        # 再生中に要求された曲は、前の曲が終わった時刻から数える
+        player.enqueue('b')
+        player.prefetch()
+        await player._prefetch[1]
+        await asyncio.sleep(0.1)
+        player.guild.voice_client.stop()
+        player._after(None)
+        while player.current is first: await asyncio.sleep(0.01)
+        return first, player.current, player
+
+    first, second, player = asyncio.run(run())
+    # 最初の曲は要求から取得 (0.05 秒) を待って始まる
+    assert first.ttfa_ms >= 50
+    # 先読み済みなら、要求から 0.1 秒以上経っていても待ち時間はほぼ無い
+    assert second.ttfa_ms < 50
+    assert list(player.recent) == [('a', first.ttfa_ms), ('b', second.ttfa_ms)]
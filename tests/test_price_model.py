@@ -0,0 +1,164 @@
+import random
+from datetime import datetime, timedelta, timezone
+import pytest
+
+np = pytest.importorskip('numpy')
+
+# ==========================================
+# PriceModel の特徴量と RSI (以前の pandas での計算式と一致すること)
+# ==========================================
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def make_rows(n, seed=1):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        ts = START + timedelta(hours=i)
+        rows.append((ts, round(100 + rng.uniform(-20, 20), 1), ts.month, ts.day, ts.hour, None, None))
+    return rows
+
+def baseline_frame(rows):
+    # 以前の get_full_analysis と同じ計算 (pandas が無ければ、比べるテストだけを飛ばす)
+    pd = pytest.importorskip('pandas')
+    df = pd.DataFrame([r[:5] for r in rows], columns=['timestamp', 'price', 'month', 'day', 'hour'])
+    df['ma5'] = df['price'].rolling(window=5, min_periods=1).mean()
+    df['deviation'] = (df['price'] - df['ma5']) / df['ma5'] * 100
+    df['momentum'] = df['price'].diff(3).fillna(0)
+    return df
+
+def baseline_rsi(df):
+    delta = df['price'].diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=min(len(df), 14), min_periods=1).mean().iloc[-1]
+    loss = (-delta.where(delta < 0, 0)).rolling(window=min(len(df), 14), min_periods=1).mean().iloc[-1]
+    return 100.0 - (100.0 / (1.0 + (gain / loss))) if loss != 0 else 50.0
+
+def new_model(tmp_path):
+    from price_model import PriceModel
+    return PriceModel(str(tmp_path / 'history'))
+
+@pytest.mark.parametrize('chunks', [[60], [1, 1, 1, 1, 1, 55], [3, 4, 53], [7] * 8 + [4]])
+def test_features_match_baseline(tmp_path, chunks):
+    rows = make_rows(sum(chunks))
+    model = new_model(tmp_path)
+    backfill, offset = [], 0
+    # 何件ずつ追加しても、直前4件を引き継いで同じ値になる
+    for size in chunks:
+        backfill += model.append(rows[offset:offset + size])
+        offset += size
+    df = baseline_frame(rows)
+    np.testing.assert_allclose([b[0] for b in backfill], df['ma5'])
+    np.testing.assert_allclose(model.store.column('deviation'), df['deviation'])
+    np.testing.assert_allclose(model.store.column('momentum'), df['momentum'])
+    assert [b[3] for b in backfill] == [r[0] for r in rows]
+
+def test_stored_features_are_kept(tmp_path):
+    # DB に保存済みの特徴量は計算し直さず、書き戻しの対象にもしない
+    rows = make_rows(8)
+    rows[5] = rows[5][:5] + (1.5, -2.0)
+    model = new_model(tmp_path)
+    backfill = model.append(rows)
+    assert [b[3] for b in backfill] == [r[0] for i, r in enumerate(rows) if i != 5]
+    assert model.store.column('deviation')[5] == 1.5
+    assert model.store.column('momentum')[5] == -2.0
+
+@pytest.mark.parametrize('n', [2, 5, 13, 14, 15, 16, 40])
+def test_rsi_matches_baseline(tmp_path, n):
+    rows = make_rows(n, seed=n)
+    model = new_model(tmp_path)
+    model.append(rows)
+    assert model.rsi() == pytest.approx(baseline_rsi(baseline_frame(rows)))
+
+def test_rsi_without_losses(tmp_path):
+    model = new_model(tmp_path)
+    model.append([(START + timedelta(hours=i), 100.0 + i, 1, 1, i, None, None) for i in range(20)])
+    assert model.rsi() == 50.0
+
+def test_analyze_matches_baseline(tmp_path):
+    pytest.importorskip('sklearn')
+    from sklearn.ensemble import RandomForestRegressor
+    rows = make_rows(120)
+    model = new_model(tmp_path)
+    model.append(rows)
+    status, diff, rsi, score = model.analyze(3, 15, 9)
+
+    df = baseline_frame(rows)
+    rf = RandomForestRegressor(n_estimators=50, max_depth=7, random_state=42)
+    rf.fit(df[['month', 'day', 'hour', 'deviation', 'momentum']].values, df['price'].values)
+    last = df.iloc[-1]
+    pred = rf.predict(np.array([[3, 15, 9, last['deviation'], last['momentum']]]))[0]
+    assert diff == int(round(pred - last['price']))
+    assert rsi == int(round(baseline_rsi(df)))
+    assert status and isinstance(score, float)
+
+def test_refit_is_cached_until_enough_rows(tmp_path):
+    pytest.importorskip('sklearn')
+    from price_model import MODEL_REFIT_ROWS
+    model = new_model(tmp_path)
+    model.append(make_rows(30))
+    assert model.needs_refit()
+    model.analyze(1, 1, 0)
+    fitted = model.model
+    assert not model.needs_refit()
+    rows = make_rows(30 + MODEL_REFIT_ROWS)[30:]
+    model.append(rows[:-1])
+    model.analyze(1, 1, 0)
+    assert model.model is fitted and not model.needs_refit()
+    model.append(rows[-1:])
+    assert model.needs_refit()
+
+def test_sync_drops_deleted_and_changed_rows(tmp_path):
+    rows = make_rows(20)
+    model = new_model(tmp_path)
+    model.append(rows)
+    # 末尾2件が DB から削除された
+    assert model.sync(rows[17][0]) == (18, rows[17][0])
+    # 10件目以降が取り込みで書き換わった
+    assert model.sync(rows[17][0], changed_since=rows[10][0]) == (10, rows[9][0])
+    assert model.sync(None) == (0, None)
+
+def test_sync_keeps_model_and_marks_it_stale(tmp_path):
+    pytest.importorskip('sklearn')
+    rows = make_rows(30)
+    model = new_model(tmp_path)
+    model.append(rows)
+    model.refit()
+    fitted = model.model
+    # 学習範囲外 (末尾より後) しか消えていなければ古くならない
+    model.sync(rows[-1][0])
+    assert not model.stale
+    # 学習に使った行が消えても、学習し直すまでは同じモデルで予測する
+    model.sync(rows[24][0])
+    assert model.model is fitted and model.stale and model.needs_refit()
+    assert model.analyze(1, 1, 0)[0] != "AI学習中"
+    model._refit_thread.join()
+    assert model.model is not fitted and model.trained_rows == 25 and not model.stale
+
+def test_model_is_persisted_next_to_snapshot(tmp_path):
+    pytest.importorskip('sklearn')
+    rows = make_rows(30)
+    model = new_model(tmp_path)
+    model.append(rows)
+    model.refit()
+    expected = model.analyze(1, 1, 0)
+    # 再起動しても学習し直さずに同じ予測を返す
+    restarted = new_model(tmp_path)
+    assert restarted.trained_rows == 30 and not restarted.needs_refit()
+    assert restarted.analyze(1, 1, 0) == expected
+    assert restarted._refit_thread is None
+    # 停止中にスナップショットが短くなっていれば、読み込んだモデルは古いものとして扱う
+    restarted.store.truncate(20)
+    assert new_model(tmp_path).stale
+
+def test_large_history_is_fitted_in_background(tmp_path, monkeypatch):
+    pytest.importorskip('sklearn')
+    import price_model
+    monkeypatch.setattr(price_model, 'MODEL_INLINE_FIT_ROWS', 20)
+    model = new_model(tmp_path)
+    model.append(make_rows(30))
+    status, diff, rsi, score = model.analyze(1, 1, 0)
+    # 予測の中では学習を待たず、RSI だけを返す
+    assert (status, diff, score) == ("AI学習中", 0, 0.0)
+    assert rsi == int(round(model.rsi()))
+    model._refit_thread.join()
+    assert model.model is not None and model.trained_rows == 30
+    assert model.analyze(1, 1, 0)[0] != "AI学習中"
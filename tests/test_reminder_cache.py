@@ -0,0 +1,128 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip('discord')
+
+# ==========================================
+# UserReminderCache (NOTIFY の反映・読み込み中の破棄) と add_reminder の上限
+# ==========================================
+USER = 42
+# add_reminder の同時実行テストで使う利用者 (実際の Discord の ID より小さく、他のテストの範囲とも重ならない)
+DB_USER = 2_000_000
+
+class FakeConnection:
+    # get() が使う fetch だけを持つ。release を渡すと、それが set されるまで応答を返さない
+    def __init__(self, rows, release=None):
+        self.rows = rows
+        self.release = release
+        self.fetches = 0
+
+    async def fetch(self, query, user_id):
+        self.fetches += 1
+        if self.release is not None: await self.release.wait()
+        return self.rows
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    import cogs.reminders
+    conn = FakeConnection([])
+
+    @asynccontextmanager
+    async def get_db_connection():
+        yield conn
+    monkeypatch.setattr(cogs.reminders, 'get_db_connection', get_db_connection)
+    return conn
+
+def times():
+    from config import timezone_jp
+    now = datetime.now(timezone_jp).replace(microsecond=0)
+    return [now + timedelta(hours=i) for i in range(1, 4)]
+
+def test_own_add_notification_is_not_reloaded(fake_db):
+    from cogs.reminders import UserReminderCache, reminder_payload
+    t1, t2, t3 = times()
+    fake_db.rows = [(1, t1, 0)]
+    cache = UserReminderCache()
+    assert asyncio.run(cache.get(USER)) == [(1, t1, 0)]
+    # 自インスタンスで追加した分は、コミット時に届く自分の NOTIFY で読み直さない
+    cache.put(USER, 2, t2, 1)
+    cache.on_notify(reminder_payload(2, USER, t2))
+    assert cache._users[USER] == [(1, t1, 0), (2, t2, 1)]
+    assert asyncio.run(cache.get(USER)) == [(1, t1, 0), (2, t2, 1)]
+    assert fake_db.fetches == 1
+    # 他のインスタンスで追加された分は読み直させる
+    cache.on_notify(reminder_payload(3, USER, t3))
+    assert USER not in cache._users
+    fake_db.rows = [(1, t1, 0), (2, t2, 1), (3, t3, 0)]
+    assert asyncio.run(cache.get(USER)) == fake_db.rows
+    assert fake_db.fetches == 2
+
+def test_stale_load_does_not_overwrite_invalidation(fake_db):
+    from cogs.reminders import UserReminderCache
+    t1, _, _ = times()
+
+    async def run(discard):
+        fake_db.release = asyncio.Event()
+        fake_db.rows = [(1, t1, 0)]
+        cache = UserReminderCache()
+        task = asyncio.create_task(cache.get(USER))
+        await asyncio.sleep(0)
+        # 読み込み中に変更の通知が来た (または LISTEN が再接続した)
+        discard(cache)
+        fake_db.release.set()
+        return await task, cache
+
+    for discard in (lambda c: c.invalidate(USER), lambda c: c.clear()):
+        rows, cache = asyncio.run(run(discard))
+        # 呼び出し元には読めた結果を返すが、古いかもしれないのでキャッシュしない
+        assert rows == [(1, t1, 0)]
+        assert USER not in cache._users
+
+def test_done_and_stop_update_loaded_users(fake_db):
+    from cogs.reminders import UserReminderCache
+    t1, t2, _ = times()
+    fake_db.rows = [(1, t1, 0), (2, t2, 0)]
+    cache = UserReminderCache()
+    asyncio.run(cache.get(USER))
+    cache.on_notify(f"done:1:{USER}")
+    assert cache._users[USER] == [(2, t2, 0)]
+    # 読み込んでいない利用者の通知は無視する (次回 get で DB から読む)
+    cache.on_notify(f"done:5:{USER + 1}")
+    assert USER + 1 not in cache._users
+    # 停止した利用者は DB を読まずに空を返す
+    cache.on_notify(f"stop:{USER}")
+    cache.on_notify(f"stop:{USER + 1}")
+    assert asyncio.run(cache.get(USER)) == [] and asyncio.run(cache.get(USER + 1)) == []
+    assert fake_db.fetches == 1
+
+def test_concurrent_adds_respect_limit(database_url):
+    import db
+    from cogs.reminders import Reminders, REMINDER_LIMIT
+    from config import timezone_jp
+
+    async def run():
+        await db.init_db_pool()
+        try:
+            await db.init_db()
+            async with db.get_db_connection() as conn:
+                await conn.execute("DELETE FROM reminders WHERE user_id = $1", DB_USER)
+            cog = Reminders(SimpleNamespace())
+            when = datetime.now(timezone_jp) + timedelta(days=1)
+            # 上限の確認と追加が別々のトランザクションで重ならないこと
+            results = await asyncio.gather(*(cog.add_reminder(DB_USER, when + timedelta(minutes=i), 0) for i in range(12)))
+            async with db.get_db_connection() as conn:
+                count = await conn.fetchval("SELECT COUNT(*) FROM reminders WHERE user_id = $1", DB_USER)
+            return results, count, await cog.user_cache.get(DB_USER)
+        finally:
+            async with db.get_db_connection() as conn:
+                await conn.execute("DELETE FROM reminders WHERE user_id = $1", DB_USER)
+            await db.close_db_pool()
+
+    results, count, cached = asyncio.run(run())
+    added = [r for r in results if r is not None]
+    assert REMINDER_LIMIT == 3
+    assert len(added) == count == 3
+    assert sorted(r[0] for r in cached) == sorted(added)
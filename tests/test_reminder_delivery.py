@@ -0,0 +1,17 @@
+import asyncio
+
+# ==========================================
+# リマインダーの一斉配信 (bench/reminders.py の縮小版)
+# ==========================================
+COUNT = 1200
+
+def test_burst_is_delivered_once(database_url, monkeypatch):
+    # 確保クエリが複数バッチに分かれるようにする
+    monkeypatch.setattr('cogs.reminders.REMINDER_BATCH_SIZE', 100)
+    from bench.reminders import run_stress
+    sent, duplicates, fetched, elapsed, lateness = asyncio.run(run_stress(COUNT, start=1.0, latency=0.001, cached=0.75, timeout=60))
+    assert sent == COUNT
+    assert duplicates == 0
+    # キャッシュにいない利用者は fetch_user で取得して送る
+    assert fetched == COUNT // 4
+    assert lateness[0] >= 0
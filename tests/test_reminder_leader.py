@@ -0,0 +1,130 @@
+import asyncio
+import multiprocessing
+import queue
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+
+# ==========================================
+# 複数インスタンスでのリマインダー配信 (各リマインダーがちょうど1回だけ送られること)
+# ==========================================
+# 1つの Postgres に対して INSTANCES 個のプロセスを立て、それぞれがリーダー選出・LISTEN・
+# スケジューラを本物のまま動かす。Discord への送信だけを記録用の偽ユーザーに差し替える。
+# 途中でリーダーを降ろし (送信中のバッチがある状態で)、別インスタンスへの引き継ぎも確かめる。
+INSTANCES = 3
+SEEDED = 150          # 起動前に入れておく分
+ADDED = 150           # 起動後に NOTIFY 付きで追加する分
+# 実際の Discord の ID (snowflake) は 10^15 を下回らないので、小さい ID の範囲を使う
+USER_BASE = 1_000_000
+USER_LAST = USER_BASE + SEEDED + ADDED
+RUN_SECONDS = 16
+STEP_DOWN_AT = 7
+SEND_LATENCY = 0.05
+
+class FakeUser:
+    def __init__(self, user_id, index, sent):
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+        self._index = index
+        self._sent = sent
+
+    async def send(self, content=None, embed=None):
+        await asyncio.sleep(SEND_LATENCY)
+        self._sent.put((self._index, self.id))
+
+async def _instance(index, sent):
+    import db
+    from leader import LeaderElection
+    from listener import NotifyListener
+    from cogs.reminders import Reminders
+
+    bot = SimpleNamespace(leader=LeaderElection(), listener=NotifyListener())
+    bot.get_user = lambda user_id: FakeUser(user_id, index, sent)
+    await db.init_db_pool()
+    await bot.listener.start()
+    cog = Reminders(bot)
+    await cog.cog_load()
+    await bot.leader.start()
+
+    await asyncio.sleep(STEP_DOWN_AT)
+    if bot.leader.is_leader:
+        # 正常終了と同じ経路で降り、少し置いてから選出に戻る
+        await bot.leader.stop()
+        await asyncio.sleep(1)
+        await bot.leader.start()
+    await asyncio.sleep(RUN_SECONDS - STEP_DOWN_AT)
+
+    await cog.cog_unload()
+    await bot.leader.stop()
+    await bot.listener.stop()
+    await db.close_db_pool()
+
+def run_instance(index, sent):
+    asyncio.run(_instance(index, sent))
+
+async def _seed(user_ids, start, spread, reset=False):
+    import db
+    from config import timezone_jp
+    from cogs.reminders import notify_reminders, reminder_payload
+    await db.init_db_pool()
+    try:
+        await db.init_db()
+        now = datetime.now(timezone_jp)
+        async with db.get_db_connection() as conn:
+            if reset:
+                # 確保クエリは期限の来た行をすべて取るので、実行中に期限を迎える他のリマインダーがあれば行わない
+                others = await conn.fetchval("SELECT COUNT(*) FROM reminders WHERE time <= $1 AND user_id NOT BETWEEN $2 AND $3",
+                                             now + timedelta(seconds=RUN_SECONDS + 30), USER_BASE, USER_LAST)
+                if others: return others
+                await conn.execute("DELETE FROM reminders WHERE user_id BETWEEN $1 AND $2", USER_BASE, USER_LAST)
+            rows = [(u, now + timedelta(seconds=start + spread * i / len(user_ids))) for i, u in enumerate(user_ids)]
+            ids = await conn.fetch("INSERT INTO reminders (user_id, time, interval_weeks) SELECT u, t, 0 FROM unnest($1::bigint[], $2::timestamptz[]) AS x(u, t) RETURNING id, user_id, time",
+                                   [u for u, _ in rows], [t for _, t in rows])
+            await notify_reminders(conn, *(reminder_payload(r['id'], r['user_id'], r['time']) for r in ids))
+        return 0
+    finally:
+        await db.close_db_pool()
+
+async def _remaining():
+    import db
+    await db.init_db_pool()
+    try:
+        async with db.get_db_connection() as conn:
+            return await conn.fetchval("SELECT COUNT(*) FROM reminders WHERE user_id BETWEEN $1 AND $2", USER_BASE, USER_LAST)
+    finally:
+        await db.close_db_pool()
+
+def test_each_reminder_sent_exactly_once(database_url, monkeypatch):
+    monkeypatch.setenv('LEADER_RETRY_SECONDS', '0.5')
+    monkeypatch.setenv('LEADER_LOCK_KEY', '1234567001')
+    seeded = [USER_BASE + i for i in range(SEEDED)]
+    added = [USER_BASE + SEEDED + i for i in range(ADDED)]
+    # 起動 (spawn + import) に数秒かかるので、起動前の分はその後から期限が来るようにする
+    others = asyncio.run(_seed(seeded, 4, 6, reset=True))
+    if others: pytest.skip(f"実行中に期限を迎える既存のリマインダーが {others} 件あります")
+
+    ctx = multiprocessing.get_context('spawn')
+    sent = ctx.Queue()
+    procs = [ctx.Process(target=run_instance, args=(i, sent)) for i in range(INSTANCES)]
+    for proc in procs: proc.start()
+    time.sleep(6)
+    # 動作中に追加した分は NOTIFY でリーダーのヒープに入る
+    asyncio.run(_seed(added, 1, 4))
+
+    records = []
+    deadline = time.monotonic() + RUN_SECONDS + 30
+    while time.monotonic() < deadline and (any(p.is_alive() for p in procs) or not sent.empty()):
+        try: records.append(sent.get(timeout=0.5))
+        except queue.Empty: pass
+    for proc in procs:
+        proc.join(timeout=5)
+        assert proc.exitcode == 0
+
+    counts = Counter(user_id for _, user_id in records)
+    assert set(counts) == set(seeded + added), f"未送信: {len(set(seeded + added) - set(counts))} 件"
+    assert max(counts.values()) == 1, f"重複送信: {[u for u, n in counts.items() if n > 1][:10]}"
+    # 引き継ぎが起きていること (2つ以上のインスタンスが送信している)
+    assert len({index for index, _ in records}) >= 2
+    assert asyncio.run(_remaining()) == 0
@@ -0,0 +1,82 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+
+pytest.importorskip('discord')
+
+# ==========================================
+# ReminderScheduler のヒープ順序 (DB を使わない部分)
+# ==========================================
+def make_scheduler(dispatch=None):
+    from cogs.reminders import ReminderScheduler
+
+    async def noop(): pass
+    scheduler = ReminderScheduler(dispatch or noop)
+    # start() は DB から読み込むので、push を受け付ける状態だけ作る
+    scheduler._task = object()
+    return scheduler
+
+def test_pop_due_takes_only_expired_entries():
+    from config import timezone_jp
+    now = datetime.now(timezone_jp)
+    scheduler = make_scheduler()
+    for r_id, minutes in [(1, 30), (2, -5), (3, 10), (4, -1), (5, 0)]:
+        scheduler.push(r_id, 100 + r_id, now + timedelta(minutes=minutes))
+
+    assert scheduler._pop_due(now)
+    assert sorted(scheduler._entries) == [1, 3]
+    # 残りのうち一番早い期限が先頭に来ている
+    assert scheduler._heap[0] == (now + timedelta(minutes=10), 3)
+    assert 9 * 60 < scheduler._next_delay() <= 10 * 60
+    assert not scheduler._pop_due(now)
+
+def test_rescheduled_and_discarded_entries_are_skipped():
+    from config import timezone_jp
+    now = datetime.now(timezone_jp)
+    scheduler = make_scheduler()
+    scheduler.push(1, 7, now + timedelta(minutes=1))
+    scheduler.push(2, 8, now + timedelta(minutes=2))
+    # 繰り返しの次回時刻への更新: 古い要素はヒープに残るが取り出し時に捨てられる
+    scheduler.push(1, 7, now + timedelta(hours=1))
+    assert len(scheduler._heap) == 3
+    assert 60 < scheduler._next_delay() <= 120
+    assert not scheduler._pop_due(now + timedelta(minutes=1))
+
+    scheduler.discard_user(8)
+    assert 59 * 60 < scheduler._next_delay() <= 3600
+    scheduler.discard_user(7)
+    assert scheduler._next_delay() is None
+    assert scheduler._heap == []
+
+def test_duplicate_push_is_ignored():
+    from config import timezone_jp
+    when = datetime.now(timezone_jp) + timedelta(minutes=1)
+    scheduler = make_scheduler()
+    scheduler.push(1, 7, when)
+    scheduler.on_notify(f"add:1:7:{when.isoformat()}")
+    assert scheduler._heap == [(when, 1)]
+
+def test_run_wakes_for_earlier_push():
+    from config import timezone_jp
+    fired = []
+
+    async def run():
+        async def dispatch():
+            fired.append(sorted(scheduler._entries))
+
+        scheduler = make_scheduler(dispatch)
+        scheduler._task = asyncio.create_task(scheduler._run())
+        try:
+            now = datetime.now(timezone_jp)
+            scheduler.push(1, 7, now + timedelta(hours=1))
+            await asyncio.sleep(0.05)
+            # 眠っている最中に、より早い期限が入ったら起きて処理する
+            scheduler.push(2, 8, now + timedelta(seconds=0.2))
+            scheduler.push(3, 9, now + timedelta(seconds=0.4))
+            await asyncio.sleep(0.8)
+        finally:
+            await scheduler.stop()
+
+    asyncio.run(run())
+    # 期限順に1件ずつ取り出され、そのたびに配信処理が呼ばれる
+    assert fired == [[1, 3], [1]]
@@ -0,0 +1,24 @@
+import pytest
+
+pytest.importorskip('discord')
+
+# ==========================================
+# 起動時の import (重い依存が初回利用まで読み込まれないこと)
+# ==========================================
+# 結果は pytest -s で表示される (詳しい内訳は python -m bench.startup)
+def test_startup_does_not_import_heavy_modules():
+    from bench.startup import measure, report, SCENARIOS
+    results = {name: measure(*SCENARIOS[name], top=5) for name in ('startup', 'startup (anime, reminders only)')}
+    report(results)
+    for r in results.values():
+        assert r['heavy'] == []
+
+def test_disabled_features_are_not_imported():
+    from bench.startup import measure, STARTUP
+    code = STARTUP + "\nassert 'cogs.music' not in sys.modules and 'cogs.prediction' not in sys.modules"
+    measure(code, {'DISABLED_FEATURES': 'music,prediction'})
+
+def test_music_loads_yt_dlp_on_first_use():
+    pytest.importorskip('yt_dlp')
+    from bench.startup import measure, SCENARIOS
+    assert measure(*SCENARIOS['music first use'])['heavy'] == ['yt_dlp']
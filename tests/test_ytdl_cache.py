@@ -0,0 +1,77 @@
+import asyncio
+import time
+import pytest
+
+pytest.importorskip('discord')
+
+# ==========================================
+# yt-dlp 抽出結果のキャッシュ (キーの正規化・期限・同時要求のまとめ・SQLite 保存)
+# ==========================================
+@pytest.mark.parametrize('query, key', [
+    ("https://www.youtube.com/watch?v=dQw4w9WgXcQ", "yt:dQw4w9WgXcQ"),
+    ("https://youtube.com/watch?v=dQw4w9WgXcQ&t=42s&list=PL1", "yt:dQw4w9WgXcQ"),
+    ("https://m.youtube.com/watch?feature=share&v=dQw4w9WgXcQ", "yt:dQw4w9WgXcQ"),
+    ("  https://youtu.be/dQw4w9WgXcQ?si=abc  ", "yt:dQw4w9WgXcQ"),
+    ("https://www.youtube.com/shorts/abcdefghijk", "yt:abcdefghijk"),
+    ("https://soundcloud.com/artist/track", "https://soundcloud.com/artist/track"),
+    ("  Never  Gonna   GIVE you up ", "search:never gonna give you up"),
+])
+def test_cache_key(query, key):
+    from cogs.music import ytdl_cache_key
+    assert ytdl_cache_key(query) == key
+
+def test_expires_at_uses_signed_url_expiry():
+    from cogs.music import ytdl_expires_at, YTDL_EXPIRE_MARGIN, YTDL_CACHE_TTL
+    now = time.time()
+    expire = int(now) + 600
+    assert ytdl_expires_at({'url': f"https://r1.googlevideo.com/videoplayback?expire={expire}&ei=x"}) == expire - YTDL_EXPIRE_MARGIN
+    # URL の期限が TTL より先でも TTL を超えて持たない
+    far = ytdl_expires_at({'url': f"https://r1.googlevideo.com/videoplayback?expire={int(now) + 10 * 86400}"})
+    assert now + YTDL_CACHE_TTL - 1 <= far <= time.time() + YTDL_CACHE_TTL
+    for data in ({'url': "https://example.com/a.m4a"}, {'url': "https://example.com/a?expire=soon"}, {}):
+        assert now + YTDL_CACHE_TTL - 1 <= ytdl_expires_at(data) <= time.time() + YTDL_CACHE_TTL
+
+def test_concurrent_requests_share_one_extraction(stub_ytdl):
+    from cogs.music import ExtractionCache
+
+    async def run():
+        cache = ExtractionCache(8)
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(cache.extract("never gonna give you up", loop) for _ in range(5)))
+        # 検索語で引いた結果は動画 ID でも引ける
+        again = await cache.extract("https://youtu.be/dQw4w9WgXcQ", loop)
+        return results, again
+
+    results, again = asyncio.run(run())
+    assert stub_ytdl.calls == ["never gonna give you up"]
+    assert all(r == results[0] for r in results)
+    assert again['title'] == 'song'
+    # 必要な項目だけを保持する
+    assert 'formats' not in results[0]
+
+def test_expired_and_evicted_entries_are_refetched():
+    from cogs.music import ExtractionCache
+    cache = ExtractionCache(2)
+    cache._put(['a'], time.time() - 1, {'title': 'old'})
+    assert cache.get('a') is None
+    cache._put(['b'], time.time() + 60, {'title': 'b'})
+    cache._put(['c'], time.time() + 60, {'title': 'c'})
+    cache.get('b')
+    cache._put(['d'], time.time() + 60, {'title': 'd'})
+    # 直近に使っていない c が追い出される
+    assert cache.get('c') is None
+    assert cache.get('b') == {'title': 'b'}
+
+def test_persisted_entries_survive_restart(stub_ytdl, tmp_path):
+    from cogs.music import ExtractionCache
+    path = str(tmp_path / 'ytdl.sqlite')
+
+    async def run(cache):
+        return await cache.extract("never gonna give you up", asyncio.get_running_loop())
+
+    first = asyncio.run(run(ExtractionCache(8, path)))
+    # 再起動後は抽出せずに保存済みの結果を返す
+    second = asyncio.run(run(ExtractionCache(8, path)))
+    assert second == first
+    assert len(stub_ytdl.calls) == 1
+    assert ExtractionCache(8, path).get("yt:dQw4w9WgXcQ") == first